@@ -0,0 +1,107 @@
+import asyncio
+import json
+import tempfile
+from collections import deque
+
+
+class SendBuffer:
+    """FIFO of outgoing messages that keeps at most `limit` of them in memory.
+
+    Once full, `put` either waits until there is room again (spill policy
+    'block'), which pushes back on whoever is sending, or appends the message
+    to a temporary file (spill policy 'disk') that is read back in order.
+    It mirrors the parts of `asyncio.Queue` that the client uses.
+    """
+
+    def __init__(self, limit, spill='block'):
+        if spill not in ('block', 'disk'):
+            raise ValueError("invalid spill policy '" + str(spill) + "', expected 'block' or 'disk'")
+        self.limit = max(1, limit)
+        self.spill = spill
+        self.memory = deque()
+        self.file = None
+        self.read_pos = 0
+        self.spilled = 0
+        self.unfinished = 0
+        self.changed = asyncio.Condition()
+        self.finished = asyncio.Event()
+        self.finished.set()
+
+    async def put(self, message):
+        async with self.changed:
+            if self.spill == 'block':
+                await self.changed.wait_for(lambda: len(self.memory) < self.limit)
+            if self.spilled or len(self.memory) >= self.limit:
+                self._spill(message)  # anything after a spilled message has to wait its turn on disk, too
+            else:
+                self.memory.append(message)
+            self.unfinished += 1
+            self.finished.clear()
+            self.changed.notify_all()
+
+    async def get(self):
+        async with self.changed:
+            await self.changed.wait_for(lambda: self.memory)
+            message = self.memory.popleft()
+            if self.spilled:
+                self.memory.append(self._unspill())
+            self.changed.notify_all()
+            return message
+
+    def task_done(self):
+        if self.unfinished <= 0:
+            raise ValueError('task_done() called too many times')
+        self.unfinished -= 1
+        if self.unfinished == 0:
+            self.finished.set()
+
+    async def join(self):
+        await self.finished.wait()
+
+    def qsize(self):
+        return len(self.memory) + self.spilled
+
+    def empty(self):
+        return self.qsize() == 0
+
+    def _spill(self, message):
+        if self.file is None:
+            self.file = tempfile.TemporaryFile()
+        self.file.seek(0, 2)
+        self.file.write(json.dumps(message).encode('utf-8') + b'\n')
+        self.spilled += 1
+
+    def _unspill(self):
+        self.file.seek(self.read_pos)
+        line = self.file.readline()
+        self.read_pos = self.file.tell()
+        self.spilled -= 1
+        if self.spilled == 0:  # start over so the file doesn't keep growing
+            self.file.seek(0)
+            self.file.truncate()
+            self.read_pos = 0
+        return json.loads(line.decode('utf-8'))
+
+
+class ReplayBuffer:
+    """Ring buffer of sent messages the server has not acknowledged yet, oldest first."""
+
+    def __init__(self, limit):
+        self.messages = deque(maxlen=max(1, limit))
+
+    def add(self, message):
+        self.messages.append(message)
+
+    def ack(self, message_num):
+        while self.messages and self.messages[0]['num'] <= message_num:
+            self.messages.popleft()
+
+    def since(self, message_num):
+        """Returns the messages after `message_num`, or None if some of them were already evicted."""
+        self.ack(message_num)
+        if self.messages and self.messages[0]['num'] > message_num + 1:
+            return None
+        return list(self.messages)
+
+    def __len__(self):
+        return len(self.messages)
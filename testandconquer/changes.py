@@ -0,0 +1,10 @@
+def affected_tests(suite_items, changed_files):
+    """Returns the locations of tests that are in a changed file or depend on a fixture from one."""
+    affected = set()
+    for item in suite_items:
+        if item.type != 'test':
+            continue
+        files = [item.location.file] + [dep.location.file for dep in item.deps or []]
+        if any(file in changed_files for file in files):
+            affected.add(item.location)
+    return affected
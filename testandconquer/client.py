@@ -6,8 +6,10 @@ import time
 from datetime import datetime
 from enum import Enum
 
+from testandconquer.buffer import ReplayBuffer, SendBuffer
+from testandconquer.compression import CompressionFactory
 from testandconquer.util import system_exit
-from testandconquer.vendor import websockets
+from testandconquer.vendor import msgpack, websockets
 from testandconquer import logger
 
 
@@ -22,11 +24,17 @@ class MessageType(Enum):
     Suite = 'suite'
 
 
+class MessageFormat(Enum):
+    JSON = 'json'
+    MessagePack = 'msgpack'
+
+
 class Client():
 
-    def __init__(self, settings):
+    def __init__(self, settings, multiplex=False):
         self.id = uuid.uuid4()
         self.daemon = True
+        self.multiplex = multiplex
         self.stopping = False
         self.connected = False
         self.subscribers = []
@@ -36,7 +44,9 @@ class Client():
         self.producer_task = None
         self.consumer_task = None
         self.connection_attempt = 0
-        self.outgoing = asyncio.Queue()
+        self.message_format = MessageFormat.JSON
+        self.outgoing = SendBuffer(settings.send_queue_limit, settings.send_queue_spill)
+        self.unacked = ReplayBuffer(settings.replay_limit)
         self.update_settings(settings)
 
     def update_settings(self, settings):
@@ -49,23 +59,41 @@ class Client():
         ]
         self.client_name = settings.client_name
         self.client_version = settings.client_version
+        self.compression = CompressionFactory.from_settings(settings)
+        self.message_formats = Client.to_message_formats(settings.message_format)
         self.system_provider = settings.system_provider
 
     @staticmethod
-    def encode(message_num, message_type, payload):
-        return json.dumps({
+    def encode(message_num, message_type, payload, worker_id=None, message_format=MessageFormat.JSON):
+        return Client.dump(Client.envelope(message_num, message_type, payload, worker_id), message_format)
+
+    @staticmethod
+    def envelope(message_num, message_type, payload, worker_id=None):
+        message = {
             'num': message_num,
             'date': datetime.utcnow().isoformat(),
             'type': message_type.value,
             'payload': payload,
-        })
+        }
+        if worker_id is not None:
+            message['worker_id'] = worker_id
+        return message
+
+    @staticmethod
+    def dump(message, message_format):
+        if message_format == MessageFormat.MessagePack:
+            return msgpack.packb(message)  # sent as a binary frame
+        return json.dumps(message)
 
     @staticmethod
     def decode(raw_message):
+        # binary frames carry MessagePack, text frames carry JSON
+        if isinstance(raw_message, bytes):
+            return msgpack.unpackb(raw_message)
         return json.loads(raw_message)
 
-    def subscribe(self, subscriber):
-        self.subscribers.append(subscriber)
+    def subscribe(self, subscriber, worker_id=None):
+        self.subscribers.append((subscriber, worker_id))
 
     async def start(self):
         logger.info('client: starting')
@@ -88,13 +116,23 @@ class Client():
         if (self.handle_task):
             self.handle_task.cancel()
 
-    async def send(self, message_type, payload):
+    async def send(self, message_type, payload, worker_id=None):
         if self.stopping:
-            logger.info('client: not sending %s since shutting down'. message_type)
+            logger.info('client: not sending %s since shutting down', message_type)
             return
         self.message_num += 1
-        message = Client.encode(self.message_num, message_type, payload)
-        await self.outgoing.put(message)
+        message = Client.envelope(self.message_num, message_type, payload, worker_id)
+        await self.outgoing.put(message)  # encoded once we know the negotiated format; blocks while the buffer is full
+
+    async def _deliver(self, message):
+        target = message.get('worker_id')  # when multiplexing, a message can be for a single worker
+        for subscriber, worker_id in self.subscribers:
+            if target is not None and worker_id is not None and target != worker_id:
+                continue
+            resp = await subscriber.on_server_message(message['type'].lower(), message['payload'])
+            if resp is not None:
+                message_type, payload = resp
+                await self.send(message_type, payload, worker_id)
 
     async def _handle(self):
         try:
@@ -103,6 +141,10 @@ class Client():
                     async for raw_message in ws:
                         message = Client.decode(raw_message)
 
+                        # the server has our messages up to this one, no need to replay them anymore
+                        if message['type'].lower() == MessageType.Ack.value and 'message_num' in (message['payload'] or {}):
+                            self.unacked.ack(message['payload']['message_num'])
+
                         # if a message got lost, don't proceed
                         ignore_message_num = message['type'].lower() == MessageType.Error.value
                         if not ignore_message_num and message['num'] - self.last_acked_message_num > 1:
@@ -117,11 +159,7 @@ class Client():
                             continue
 
                         # let subscribers send a reply to the message
-                        for subscriber in self.subscribers:
-                            resp = await subscriber.on_server_message(message['type'].lower(), message['payload'])
-                            if resp is not None:
-                                message_type, payload = resp
-                                await self.send(message_type, payload)
+                        await self._deliver(message)
 
                         # ack the message so the server knows it arrived
                         await self.send(MessageType.Ack, {'message_num': message['num'], 'status': 'success'})
@@ -135,8 +173,11 @@ class Client():
                 try:
                     while True:
                         message = await self.outgoing.get()  # blocks forever until something is available
-                        await ws.send(message)
-                        self.outgoing.task_done()
+                        self.unacked.add(message)  # before sending, so it's replayed if the connection drops meanwhile
+                        try:
+                            await ws.send(Client.dump(message, self.message_format))
+                        finally:
+                            self.outgoing.task_done()
                 except asyncio.CancelledError:
                     pass  # we are shutting down
 
@@ -154,12 +195,15 @@ class Client():
                     ('X-Connection-ID', str(self.id)),
                     ('X-Message-Num-Client', str(self.message_num)),
                     ('X-Message-Num-Server', str(self.last_acked_message_num)),
-                    ('X-Message-Format', 'json'),
+                    ('X-Message-Format', ','.join(f.value for f in self.message_formats)),
                 ]
 
                 if self.system_provider:
                     headers.append(('X-Env', str(self.system_provider)))
 
+                if self.multiplex:
+                    headers.append(('X-Multiplex', 'true'))
+
                 if wait_before_reconnect > 0:
                     logger.info('retrying in %ss', wait_before_reconnect)
                     await asyncio.sleep(min(self.api_wait_limit, wait_before_reconnect))
@@ -170,11 +214,16 @@ class Client():
                         url,
                         ping_interval=None,     # don't send ping, that's the server's responsibility
                         max_size=None,          # accept any message size
-                        max_queue=None,         # never drop a message
+                        max_queue=32,           # stop reading while the consumer is behind (nothing gets dropped)
+                        compression=None,       # configured via extensions instead
+                        extensions=[self.compression] if self.compression else None,
                         extra_headers=headers,
                     ) as ws:
                         self.connected = True
                         self.connection_attempt = 1
+                        self.message_format = Client.negotiate(ws.response_headers.get('X-Message-Format'), self.message_formats)
+                        logger.info('using message format %s', self.message_format.value)
+                        await self._replay(ws)
 
                         # run consumer and producer in parallel
                         self.consumer_task = asyncio.ensure_future(consumer_handler(ws))
@@ -218,6 +267,19 @@ class Client():
         except Exception as err:
             logger.exception(err)
 
+    async def _replay(self, ws):
+        received = ws.response_headers.get('X-Message-Num-Server')
+        if received is None or not len(self.unacked):
+            return
+        messages = self.unacked.since(int(received))
+        if messages is None:
+            logger.warning('cannot replay messages after %s, they are no longer buffered', received)
+            return
+        if messages:
+            logger.info('replaying %s unacknowledged message(s)', len(messages))
+        for message in messages:
+            await ws.send(Client.dump(message, self.message_format))
+
     def _abort(self):
         system_exit(
             'COULD NOT CONNECT:',
@@ -230,8 +292,47 @@ class Client():
                 'Connection-ID': self.id,
             })
 
+    @staticmethod
+    def to_message_formats(preferred):
+        # JSON is always offered as the fallback
+        formats = [MessageFormat(preferred)] if preferred else []
+        if MessageFormat.JSON not in formats:
+            formats.append(MessageFormat.JSON)
+        return formats
+
+    @staticmethod
+    def negotiate(accepted, offered):
+        for message_format in offered:
+            if message_format.value == accepted:
+                return message_format
+        return MessageFormat.JSON  # the server didn't pick one of ours
+
     @staticmethod
     def to_url(domain, region):
         if domain.startswith('localhost') or domain.startswith('0.0.0.0'):  # for testing
             return 'ws://' + domain
         return 'wss://equilibrium-' + region + '.' + domain
+
+
+class Channel():
+    """A single worker's view of a `Client` that is shared by all workers of a process.
+
+    Outgoing messages are tagged with the worker's ID, and incoming messages
+    tagged for other workers are not delivered to its subscribers.
+    """
+
+    def __init__(self, client, worker_id):
+        self.client = client
+        self.worker_id = worker_id
+
+    def subscribe(self, subscriber):
+        self.client.subscribe(subscriber, self.worker_id)
+
+    async def start(self):
+        pass  # the shared client is started and stopped by its owner
+
+    async def stop(self):
+        pass
+
+    async def send(self, message_type, payload):
+        await self.client.send(message_type, payload, self.worker_id)
@@ -0,0 +1,50 @@
+from testandconquer.vendor.websockets.extensions.permessage_deflate import ClientPerMessageDeflateFactory, PerMessageDeflate
+from testandconquer.vendor.websockets.framing import CTRL_OPCODES, OP_CONT
+
+
+class ThresholdPerMessageDeflate(PerMessageDeflate):
+    """Per-message deflate that sends messages below a size threshold uncompressed.
+
+    RFC 7692 allows mixing compressed and uncompressed messages; compressing
+    a tiny ack costs more CPU than it saves bandwidth.
+    """
+
+    def __init__(self, threshold, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.threshold = threshold
+
+    def encode(self, frame):
+        if frame.opcode not in CTRL_OPCODES and frame.opcode != OP_CONT and frame.fin and len(frame.data) < self.threshold:
+            return frame
+        return super().encode(frame)
+
+
+class CompressionFactory(ClientPerMessageDeflateFactory):
+
+    def __init__(self, threshold=0, window_bits=15, mem_level=None):
+        super().__init__(
+            client_max_window_bits=window_bits,
+            compress_settings={'memLevel': mem_level} if mem_level else None,
+        )
+        self.threshold = threshold
+
+    def process_response_params(self, params, accepted_extensions):
+        extension = super().process_response_params(params, accepted_extensions)
+        return ThresholdPerMessageDeflate(
+            self.threshold,
+            extension.remote_no_context_takeover,
+            extension.local_no_context_takeover,
+            extension.remote_max_window_bits,
+            extension.local_max_window_bits,
+            extension.compress_settings,
+        )
+
+    @staticmethod
+    def from_settings(settings):
+        if not settings.compression:
+            return None
+        return CompressionFactory(
+            threshold=settings.compression_threshold,
+            window_bits=settings.compression_window_bits,
+            mem_level=settings.compression_mem_level,
+        )
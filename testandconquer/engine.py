@@ -0,0 +1,292 @@
+import asyncio
+import threading
+import time
+from collections import defaultdict
+
+from testandconquer import logger
+from testandconquer.client import MessageType
+
+
+POLL_INTERVAL = 0.05  # seconds
+
+
+class LocalEngine:
+    """Schedules the suite locally, without a server.
+
+    Files are handed out longest-first to whichever worker asks next, which is
+    the online form of longest-processing-time-first bin packing. A file's
+    weight is its recorded duration; files without one are estimated from
+    their size. Files with changed tests go before all others.
+
+    Given the setup cost of expensive fixtures, files that share session-wide
+    ones are bundled so the fixture is only set up once, as long as a bundle
+    doesn't take longer than a single worker's share of the suite.
+
+    Files with tests of the same group always go to the same worker, in a
+    single schedule. Files with singletons run while nothing else does.
+
+    The build takes as long as its slowest worker, so towards the end a file
+    that is larger than a worker's share of the remaining work is split into
+    up to `split_limit` chunks of tests, weighed by their own durations. The
+    engine keeps track of when each worker is predicted to finish its work,
+    which is also what the remaining work is estimated from.
+    """
+
+    def __init__(self, suite_items, durations=None, fixture_costs=None, workers=1, test_durations=None, split_limit=1):
+        self.lock = threading.Lock()
+        self.schedule_num = 0
+        self.pending = {}
+        self.workers = max(1, workers)
+        self.split_limit = split_limit
+        self.started_at = time.time()
+        self.predicted = {}  # by worker, in seconds since the engine started
+
+        durations = durations or {}
+        fixture_costs = fixture_costs or {}
+        size_by_file = {item.location.file: item.size or 0 for item in suite_items if item.type == 'file'}
+        files = sorted(set(item.location.file for item in suite_items if item.type == 'test'))
+        weight_by_file = LocalEngine.estimate(files, size_by_file, durations)
+        self.changed = set(item.location.file for item in suite_items if item.type == 'test' and item.changed)
+        units = LocalEngine.bundle(files, suite_items, weight_by_file, fixture_costs, workers)
+        units = LocalEngine.constrain(units, suite_items)
+        self.units = sorted([unit + (None,) for unit in units], key=self.order)
+
+        # only plain files can be split: not grouped, singleton or sharing an expensive fixture with other files
+        self.test_durations = test_durations or {}
+        self.tests_by_file = defaultdict(list)
+        for item in suite_items:
+            if item.type == 'test':
+                self.tests_by_file[item.location.file].append(item.location._replace(line=None))
+        unsplittable = LocalEngine.pinned_files(suite_items).union(LocalEngine.expensive_fixtures(suite_items, fixture_costs))
+        self.splittable = set(f for f in files if f not in unsplittable and len(self.tests_by_file[f]) > 1)
+
+    def order(self, unit):
+        files, weight, _, _ = unit
+        return (not self.changed.intersection(files), -weight, files)
+
+    @staticmethod
+    def estimate(files, size_by_file, durations):
+        # derive seconds per byte from the files we know both about, so sizes and durations can be compared
+        known = [f for f in files if f in durations]
+        known_size = sum(size_by_file.get(f, 0) for f in known)
+        seconds_per_byte = sum(durations[f] for f in known) / known_size if known_size else 1
+        return {f: durations[f] if f in durations else size_by_file.get(f, 0) * seconds_per_byte for f in files}
+
+    @staticmethod
+    def expensive_fixtures(suite_items, fixture_costs):
+        """Returns the expensive session-wide fixtures of each file."""
+        fixtures_by_file = defaultdict(set)
+        for item in suite_items:
+            if item.type != 'test':
+                continue
+            for dep in item.deps or []:
+                location = dep.location._replace(line=None)  # the way durations are recorded
+                if dep.scope in ('package', 'session') and location in fixture_costs:
+                    fixtures_by_file[item.location.file].add(location)
+        return fixtures_by_file
+
+    @staticmethod
+    def bundle(files, suite_items, weight_by_file, fixture_costs, workers):
+        fixtures_by_file = LocalEngine.expensive_fixtures(suite_items, fixture_costs)
+        files_by_fixtures = defaultdict(list)
+        for file in files:
+            files_by_fixtures[frozenset(fixtures_by_file[file])].append(file)
+
+        all_fixtures = set().union(*fixtures_by_file.values())
+        share = (sum(weight_by_file.values()) + sum(fixture_costs[f] for f in all_fixtures)) / max(1, workers)
+        units = []  # tuples of files and their total weight
+        for fixtures, group in files_by_fixtures.items():
+            if not fixtures:
+                units.extend(((file,), weight_by_file[file]) for file in group)
+                continue
+            setup_cost = sum(fixture_costs[location] for location in fixtures)
+            bundle, weight = [], setup_cost
+            for file in sorted(group, key=lambda f: (-weight_by_file[f], f)):
+                if bundle and weight + weight_by_file[file] > share:
+                    units.append((tuple(bundle), weight))  # it's cheaper to set up the fixture again elsewhere
+                    bundle, weight = [], setup_cost
+                bundle.append(file)
+                weight += weight_by_file[file]
+            units.append((tuple(bundle), weight))
+        return units
+
+    @staticmethod
+    def pinned_files(suite_items):
+        """Returns the files whose tests have to stay on the worker they were scheduled on."""
+        return set(item.location.file for item in suite_items if any(tag.group or tag.singleton for tag in item.tags or []))
+
+    @staticmethod
+    def constrain(units, suite_items):
+        groups_by_file = defaultdict(set)
+        singleton_files = set()
+        for item in suite_items:
+            for tag in item.tags or []:
+                if tag.group:
+                    groups_by_file[item.location.file].add(tag.group)
+                if tag.singleton:
+                    singleton_files.add(item.location.file)
+
+        # merge all units that share a group, so the group ends up on a single worker
+        merged = []  # lists of files, weight and groups
+        merged_by_group = {}
+        for files, weight in units:
+            unit = [list(files), weight, set().union(*[groups_by_file.get(f, set()) for f in files])]
+            for group in list(unit[2]):
+                other = merged_by_group.get(group)
+                if other is None or other is unit:
+                    continue
+                unit[0].extend(other[0])
+                unit[1] += other[1]
+                unit[2] |= other[2]
+                merged = [m for m in merged if m is not other]
+            merged.append(unit)
+            for group in unit[2]:
+                merged_by_group[group] = unit
+
+        return [(tuple(sorted(files)), weight, any(f in singleton_files for f in files)) for files, weight, _ in merged]
+
+    def next(self, worker_id):
+        """Returns the next schedule for the worker, or None if there is none right now."""
+        with self.lock:
+            if any(singleton for _, _, singleton in self.pending.values()):
+                return None  # a singleton runs alone
+            for i, (files, _, singleton, _) in enumerate(self.units):
+                if not singleton or not self.pending:
+                    break
+            else:
+                return None  # only singletons left, and they have to wait for the others to finish
+            now = time.time() - self.started_at
+            if self.in_tail(self.units[i], now):
+                i = self.split(i)  # sorting moved the units around
+            files, weight, singleton, tests = self.units.pop(i)
+
+            self.schedule_num += 1
+            schedule_id = str(self.schedule_num)
+            self.pending[schedule_id] = (worker_id, files, singleton)
+            self.predicted[worker_id] = max(self.predicted.get(worker_id, 0), now) + weight
+            logger.info('local engine: assigning %s to worker %s, predicted to finish after %.1fs',
+                        ', '.join(files) if tests is None else '%s test(s) of %s' % (len(tests), files[0]),
+                        worker_id, self.predicted[worker_id])
+            if tests is None:
+                items = [{'file': file} for file in files]
+            else:
+                items = [{'file': test.file, 'class': test.cls, 'func': test.func} for test in tests]
+            return {'id': schedule_id, 'items': items}
+
+    def in_tail(self, unit, now):
+        # splitting only pays off once a file takes longer than a worker's share of what is left to do
+        files, weight, _, tests = unit
+        if tests is not None or len(files) != 1 or files[0] not in self.splittable or self.split_limit < 2:
+            return False
+        remaining = sum(u[1] for u in self.units) + sum(max(0, p - now) for p in self.predicted.values())
+        return weight > remaining / self.workers
+
+    def split(self, i):
+        (file,), weight, singleton, _ = self.units.pop(i)
+        tests = self.tests_by_file[file]
+        parts = min(self.split_limit, self.workers, len(tests))
+
+        # known test durations are scaled so the chunks add up to the file's weight, which includes setup and teardown
+        known = [self.test_durations[t] for t in tests if t in self.test_durations]
+        default = sum(known) / len(known) if known else 1
+        test_weights = [self.test_durations.get(t, default) for t in tests]
+        scale = weight / sum(test_weights) if sum(test_weights) else 0
+
+        # chunks keep the order of the tests, so fixtures of a module or class are shared as much as possible
+        chunks, total, target = [[[], 0]], 0, weight / parts
+        for test, test_weight in zip(tests, test_weights):
+            if chunks[-1][0] and total >= target * len(chunks) and len(chunks) < parts:
+                chunks.append([[], 0])
+            chunks[-1][0].append(test)
+            chunks[-1][1] += test_weight * scale
+            total += test_weight * scale
+        logger.info('local engine: splitting %s into %s chunk(s)', file, len(chunks))
+
+        self.units.extend(((file,), chunk_weight, singleton, tuple(chunk)) for chunk, chunk_weight in chunks)
+        self.units.sort(key=self.order)
+        return next(j for j, unit in enumerate(self.units) if unit[0] == (file,) and unit[3] is not None)
+
+    def predictions(self):
+        """Returns when each worker is predicted to finish the work it was given, in seconds since the start."""
+        with self.lock:
+            return dict(self.predicted)
+
+    def exhausted(self):
+        with self.lock:
+            return not self.units
+
+    def complete(self, worker_id, schedule_id):
+        with self.lock:
+            self.pending.pop(schedule_id, None)
+            if not any(w == worker_id for w, _, _ in self.pending.values()) and worker_id in self.predicted:
+                # the worker is done with everything it was given, whatever was predicted
+                self.predicted[worker_id] = min(self.predicted[worker_id], time.time() - self.started_at)
+
+
+class LocalClient:
+    """Drop-in replacement for the `Client` that talks to a `LocalEngine` instead of the server."""
+
+    def __init__(self, settings, engine, worker_id):
+        self.engine = engine
+        self.worker_id = worker_id
+        self.subscribers = []
+        self.done = False
+        self.waiting = 0
+        self.poll_task = None
+        prefetch = settings.prefetch
+        self.prefetch = prefetch if isinstance(prefetch, int) else 1
+
+    def subscribe(self, subscriber):
+        self.subscribers.append(subscriber)
+
+    async def start(self):
+        logger.info('local client: starting')
+        await self._schedule(1 + self.prefetch)  # the one to work on plus the prefetched ones
+
+    async def stop(self):
+        logger.info('local client: shutting down')
+        if self.poll_task is not None:
+            self.poll_task.cancel()
+
+    async def send(self, message_type, payload):
+        if message_type == MessageType.Ack and 'schedule_id' in payload:
+            acks = [payload]
+        elif message_type == MessageType.Report:
+            acks = payload.get('acks', [])  # acks piggy-backing on a streamed report
+        else:
+            return
+        for ack in acks:
+            self.engine.complete(self.worker_id, ack['schedule_id'])
+        if acks:
+            await self._schedule(len(acks))
+
+    async def _schedule(self, count):
+        schedules = []
+        for _ in range(count):
+            schedule = self.engine.next(self.worker_id)
+            if schedule is None:
+                break
+            schedules.append(schedule)
+        if schedules:
+            await self._dispatch(MessageType.Schedules, schedules)
+        if len(schedules) < count and not self.done:
+            if self.engine.exhausted():
+                self.done = True
+                await self._dispatch(MessageType.Done, None)
+            else:
+                # held back until the node is free for a singleton, so the worker has to finish what it has;
+                # repeated on every poll, since the worker might have started waiting again in the meantime
+                await self._dispatch(MessageType.Schedules, [])
+                self.waiting += count - len(schedules)
+                if self.poll_task is None or self.poll_task.done():
+                    self.poll_task = asyncio.ensure_future(self._poll())
+
+    async def _poll(self):
+        while self.waiting and not self.done:
+            await asyncio.sleep(POLL_INTERVAL)
+            count, self.waiting = self.waiting, 0
+            await self._schedule(count)
+
+    async def _dispatch(self, message_type, payload):
+        for subscriber in self.subscribers:
+            await subscriber.on_server_message(message_type.value, payload)
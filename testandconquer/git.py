@@ -1,5 +1,8 @@
 import os
+import re
 import subprocess
+import threading
+import zlib
 
 try:
     from subprocess import DEVNULL
@@ -8,26 +11,159 @@ except ImportError:
 
 
 class Git:
+    """Reads the repository metadata straight from the `.git` directory.
+
+    Only the commit message of a packed commit needs the `git` executable.
+    Results are cached per working directory for the lifetime of the process.
+    Diffs are left to `git` itself.
+    """
+
+    cache = {}
+    lock = threading.Lock()
 
     @staticmethod
     def branch(cwd):
-        return Git.exec(['rev-parse', '--abbrev-ref', 'HEAD'], cwd)
+        return Git.metadata(cwd).get('branch')
 
     @staticmethod
     def repo(cwd):
-        return Git.exec(['config', '--get', 'remote.origin.url'], cwd)
+        return Git.metadata(cwd).get('repo')
 
     @staticmethod
     def revision(cwd):
-        return Git.exec(['rev-parse', 'HEAD'], cwd)
+        return Git.metadata(cwd).get('revision')
 
     @staticmethod
     def revision_message(cwd):
-        return Git.exec(['log', '-1', '--pretty=%B'], cwd)
+        return Git.metadata(cwd).get('revision_message')
+
+    @staticmethod
+    def changed_files(cwd, base):
+        """Returns the files that differ from `base`, including uncommitted and untracked ones, relative to `cwd`."""
+        changed = Git.exec(['diff', '--name-only', '--relative', base, '--'], cwd)
+        if changed is None:
+            return None
+        untracked = Git.exec(['ls-files', '--others', '--exclude-standard'], cwd) or ''
+        return set(line for line in (changed + '\n' + untracked).splitlines() if line)
+
+    @staticmethod
+    def metadata(cwd):
+        cwd = os.path.abspath(cwd or os.getcwd())
+        with Git.lock:
+            if cwd not in Git.cache:
+                Git.cache[cwd] = Git.read(cwd)
+            return Git.cache[cwd]
+
+    @staticmethod
+    def read(cwd):
+        git_dir = Git.find_git_dir(cwd)
+        if git_dir is None:
+            return {}
+        common_dir = Git.find_common_dir(git_dir)
+
+        head = Git.read_file(os.path.join(git_dir, 'HEAD'))
+        if head is None:
+            return {}
+        if head.startswith('ref:'):
+            ref = head[4:].strip()
+            branch = ref[len('refs/heads/'):] if ref.startswith('refs/heads/') else ref
+            revision = Git.resolve_ref(git_dir, common_dir, ref)
+        else:
+            branch = 'HEAD'  # detached, same as 'git rev-parse --abbrev-ref HEAD'
+            revision = head
+
+        message = None
+        if revision:
+            message = Git.read_commit_message(common_dir, revision)
+            if message is None:  # not a loose object, must be in a pack
+                message = Git.exec(['log', '-1', '--pretty=%B', revision], cwd)
+
+        return {
+            'branch': branch,
+            'repo': Git.read_config(common_dir).get(('remote "origin"', 'url')),
+            'revision': revision,
+            'revision_message': message,
+        }
+
+    @staticmethod
+    def find_git_dir(cwd):
+        path = cwd
+        while True:
+            candidate = os.path.join(path, '.git')
+            if os.path.isdir(candidate):
+                return candidate
+            if os.path.isfile(candidate):  # worktree or submodule
+                content = Git.read_file(candidate) or ''
+                if content.startswith('gitdir:'):
+                    return os.path.normpath(os.path.join(path, content[len('gitdir:'):].strip()))
+                return None
+            parent = os.path.dirname(path)
+            if parent == path:
+                return None
+            path = parent
+
+    @staticmethod
+    def find_common_dir(git_dir):
+        common_dir = Git.read_file(os.path.join(git_dir, 'commondir'))
+        if common_dir:
+            return os.path.normpath(os.path.join(git_dir, common_dir))
+        return git_dir
+
+    @staticmethod
+    def resolve_ref(git_dir, common_dir, ref):
+        for directory in (git_dir, common_dir):
+            sha = Git.read_file(os.path.join(directory, *ref.split('/')))
+            if sha:
+                return sha
+        packed_refs = Git.read_file(os.path.join(common_dir, 'packed-refs')) or ''
+        for line in packed_refs.splitlines():
+            if line.startswith('#') or line.startswith('^'):
+                continue
+            parts = line.split(' ', 1)
+            if len(parts) == 2 and parts[1] == ref:
+                return parts[0]
+        return None  # e.g. a fresh repository without any commits
+
+    @staticmethod
+    def read_commit_message(common_dir, revision):
+        path = os.path.join(common_dir, 'objects', revision[:2], revision[2:])
+        try:
+            with open(path, 'rb') as f:
+                data = zlib.decompress(f.read())
+        except (OSError, zlib.error):
+            return None
+        header, _, body = data.partition(b'\0')
+        if not header.startswith(b'commit '):
+            return None
+        _, _, message = body.partition(b'\n\n')  # headers come first
+        return message.decode('utf-8', 'replace').strip()
+
+    @staticmethod
+    def read_config(common_dir):
+        values = {}
+        section = None
+        for line in (Git.read_file(os.path.join(common_dir, 'config')) or '').splitlines():
+            line = line.strip()
+            match = re.match(r'^\[([^\]]+)\]', line)
+            if match:
+                section = match.group(1).strip()
+                continue
+            match = re.match(r'^([A-Za-z][A-Za-z0-9-]*)\s*=\s*(.*)$', line)
+            if match and section:
+                values[(section, match.group(1).lower())] = match.group(2).strip().strip('"')
+        return values
+
+    @staticmethod
+    def read_file(path):
+        try:
+            with open(path, 'r') as f:
+                return f.read().strip()
+        except (OSError, UnicodeDecodeError):
+            return None
 
     @staticmethod
     def exec(args, cwd):
         try:
-            return str(subprocess.check_output(['git'] + args, cwd=cwd or os.getcwd()).strip())
-        except subprocess.CalledProcessError:
+            return subprocess.check_output(['git'] + args, cwd=cwd or os.getcwd(), stderr=DEVNULL).decode('utf-8', 'replace').strip()
+        except (OSError, subprocess.CalledProcessError):
             return None
@@ -0,0 +1,125 @@
+import json
+import math
+import os
+import sqlite3
+import threading
+from collections import defaultdict
+
+from testandconquer import logger
+from testandconquer.model import Duration, Location
+from testandconquer.util import ewma
+
+
+MAX_SAMPLES = 20
+
+
+class History:
+    """Per-location durations of previous runs, stored in a SQLite database.
+
+    Durations are buffered in memory while tests run and merged into the
+    database with `save`. Each location keeps a sample count, an EWMA and the
+    p95 of its most recent samples.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.buffer = []
+        self.loaded = None
+
+    @staticmethod
+    def open(config):
+        cache = getattr(config, 'cache', None)
+        if cache is None:  # e.g. when the cacheprovider plugin is disabled
+            return None
+        return History(os.path.join(str(cache.makedir('conquer')), 'history.sqlite'))
+
+    def record(self, item):
+        if item.started_at is None or item.finished_at is None:
+            return
+        duration = (item.finished_at - item.started_at).total_seconds()
+        with self.lock:
+            self.buffer.append((History.key(item.type, item.location), duration))
+
+    def load(self):
+        if not os.path.exists(self.path):
+            return {}
+        try:
+            db = self._connect()
+            try:
+                rows = db.execute('SELECT type, file, module, cls, func, count, ewma, p95 FROM durations').fetchall()
+            finally:
+                db.close()
+        except sqlite3.Error as err:
+            logger.warning('could not read durations: %s', err)
+            return {}
+        return {(type, Location(file, module or None, cls or None, func or None)): Duration(count, avg, p95)
+                for (type, file, module, cls, func, count, avg, p95) in rows}
+
+    def durations(self):
+        """Like `load`, but reads the database only once until the next `save`."""
+        with self.lock:
+            if self.loaded is None:
+                self.loaded = self.load()
+            return self.loaded
+
+    def file_durations(self):
+        durations = defaultdict(float)
+        for (type, location), duration in self.durations().items():
+            durations[location.file] += duration.ewma
+        return dict(durations)
+
+    def test_durations(self):
+        return {location: duration.ewma for (type, location), duration in self.durations().items() if type == 'test'}
+
+    def setup_durations(self):
+        return {location: duration.ewma for (type, location), duration in self.durations().items() if type == 'setup'}
+
+    def save(self):
+        with self.lock:
+            buffer, self.buffer = self.buffer, []
+            self.loaded = None
+        if not buffer:
+            return
+        try:
+            db = self._connect()
+            try:
+                db.execute('BEGIN IMMEDIATE')  # other worker processes might save at the same time
+                for (key, duration) in buffer:
+                    self._update(db, key, duration)
+                db.execute('COMMIT')
+            finally:
+                db.close()
+        except sqlite3.Error as err:
+            logger.warning('could not save durations: %s', err)
+
+    def _connect(self):
+        db = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        db.execute(
+            'CREATE TABLE IF NOT EXISTS durations ('
+            'type TEXT NOT NULL, file TEXT NOT NULL, module TEXT NOT NULL, cls TEXT NOT NULL, func TEXT NOT NULL, '
+            'count INTEGER NOT NULL, ewma REAL NOT NULL, p95 REAL NOT NULL, samples TEXT NOT NULL, '
+            'PRIMARY KEY (type, file, module, cls, func))')
+        return db
+
+    def _update(self, db, key, duration):
+        row = db.execute(
+            'SELECT count, ewma, samples FROM durations WHERE type = ? AND file = ? AND module = ? AND cls = ? AND func = ?',
+            key).fetchone()
+        count, avg, samples = (row[0], row[1], json.loads(row[2])) if row else (0, None, [])
+        samples = (samples + [duration])[-MAX_SAMPLES:]
+        db.execute(
+            'INSERT OR REPLACE INTO durations (type, file, module, cls, func, count, ewma, p95, samples) '
+            'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+            key + (count + 1, ewma(avg, duration), History.percentile(samples, 95), json.dumps(samples)))
+
+    @staticmethod
+    def key(type, location):
+        # SQLite treats NULLs as distinct in primary keys, hence the empty strings
+        return (type, location.file, location.module or '', location.cls or '', location.func or '')
+
+    @staticmethod
+    def percentile(samples, percent):
+        ordered = sorted(samples)
+        rank = max(1, int(math.ceil(percent / 100 * len(ordered))))
+        return ordered[rank - 1]
@@ -0,0 +1,108 @@
+import ast
+import functools
+import inspect
+import os
+import threading
+
+
+def source_line(obj):
+    """Returns the line a function or class is defined on (its first decorator, if any), like `inspect.getsourcelines`."""
+    obj = inspect.unwrap(obj)
+    if inspect.ismethod(obj):
+        obj = obj.__func__
+    code = getattr(obj, '__code__', None)
+    if code is not None:
+        return code.co_firstlineno
+    if inspect.isclass(obj):
+        line = class_lines(inspect.getfile(obj)).get(obj.__qualname__)
+        if line is not None:
+            return line
+    return inspect.getsourcelines(obj)[1]
+
+
+@functools.lru_cache(maxsize=None)
+def class_lines(path):
+    """Parses a module once and returns the definition line of each class by qualified name."""
+    try:
+        with open(path, 'rb') as f:
+            tree = ast.parse(f.read(), path)
+    except (OSError, SyntaxError, ValueError):
+        return {}
+    lines = {}
+
+    def visit(node, prefix):
+        for child in ast.iter_child_nodes(node):
+            if isinstance(child, ast.ClassDef):
+                name = prefix + child.name
+                lines[name] = child.decorator_list[0].lineno if child.decorator_list else child.lineno
+                visit(child, name + '.')
+            elif isinstance(child, (ast.FunctionDef, ast.AsyncFunctionDef)):
+                visit(child, prefix + child.name + '.<locals>.')
+            else:
+                visit(child, prefix)
+
+    visit(tree, '')
+    return lines
+
+
+class LocationCache:
+    """Line numbers of classes from previous runs, stored in pytest's cache.
+
+    Lines are grouped by source file and only used while the file's
+    modification time and size are unchanged, so an edited file is
+    introspected again.
+    """
+
+    key = 'conquer/locations'
+
+    def __init__(self, cache):
+        self.cache = cache
+        self.lock = threading.Lock()
+        self.files = cache.get(LocationCache.key, None) or {}
+        self.checked = set()
+        self.dirty = False
+
+    @staticmethod
+    def open(config):
+        cache = getattr(config, 'cache', None)
+        if cache is None:  # e.g. when the cacheprovider plugin is disabled
+            return None
+        return LocationCache(cache)
+
+    def line(self, path, name):
+        with self.lock:
+            entry = self._entry(path)
+            return entry['lines'].get(name)
+
+    def store(self, path, name, line):
+        with self.lock:
+            entry = self._entry(path)
+            if entry['lines'].get(name) != line:
+                entry['lines'][name] = line
+                self.dirty = True
+
+    def save(self):
+        with self.lock:
+            if not self.dirty:
+                return
+            self.files = {path: entry for path, entry in self.files.items() if path in self.checked or os.path.exists(path)}
+            self.cache.set(LocationCache.key, self.files)
+            self.dirty = False
+
+    def _entry(self, path):
+        entry = self.files.get(path)
+        if path not in self.checked:
+            self.checked.add(path)
+            stat = LocationCache.stat(path)
+            if entry is None or entry['stat'] != stat:
+                entry = self.files[path] = {'stat': stat, 'lines': {}}
+                self.dirty = True
+        return entry
+
+    @staticmethod
+    def stat(path):
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        return [st.st_mtime_ns, st.st_size]
@@ -1,7 +1,7 @@
 from collections import namedtuple
 
 SuiteItem = \
-    namedtuple('SuiteItem', ['type', 'location', 'details', 'size', 'scope', 'tags', 'deps'])
+    namedtuple('SuiteItem', ['type', 'location', 'details', 'size', 'scope', 'tags', 'deps', 'changed'])
 SuiteItem.__new__.__defaults__ = (None,) * len(SuiteItem._fields)
 
 ReportItem = \
@@ -15,7 +15,8 @@ Schedule = \
     namedtuple('Schedule', ['id', 'items'])
 
 ScheduleItem = \
-    namedtuple('ScheduleItem', ['file'])
+    namedtuple('ScheduleItem', ['file', 'cls', 'func'])
+ScheduleItem.__new__.__defaults__ = (None,) * len(ScheduleItem._fields)
 
 Location = \
     namedtuple('Location', ['file', 'module', 'cls', 'func', 'line'])
@@ -27,3 +28,6 @@ Tag.__new__.__defaults__ = (None,) * len(Tag._fields)
 
 Failure = \
     namedtuple('Failure', ['type', 'message'])
+
+Duration = \
+    namedtuple('Duration', ['count', 'ewma', 'p95'])
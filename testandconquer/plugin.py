@@ -1,28 +1,45 @@
 import asyncio
+import concurrent.futures
 import functools
+import gc
 import os.path
 import os
 import inspect
+import multiprocessing
+import queue
 import sys
 import threading
 import uuid
-import itertools
 from collections import defaultdict
 from datetime import datetime
+from multiprocessing.managers import BaseManager
 
 import pytest
 from _pytest import main
 
-from testandconquer.client import Client
+from testandconquer.changes import affected_tests
+from testandconquer.client import Channel, Client
+from testandconquer.engine import LocalClient, LocalEngine
+from testandconquer.git import Git
+from testandconquer.history import History
+from testandconquer.locations import LocationCache, source_line
 from testandconquer.model import Failure, Location, SuiteItem, Report, ReportItem, Tag
-from testandconquer.scheduler import Scheduler
+from testandconquer.runqueue import RunQueue, ScheduleTracker
+from testandconquer.scheduler import Scheduler, suite_cache
+from testandconquer.serializer import CompactSerializer, Serializer
 from testandconquer.settings import Settings
 from testandconquer.util import system_exit
 from testandconquer import logger
 
 
 fatal_error = None
+history = None
+local_engine = None
+location_cache = None
+pinned_files = set()
 report_items_by_worker = {}
+run_queues = {}
+schedule_tracker = ScheduleTracker()
 schedulers = []
 settings = None
 suite_items = []
@@ -30,6 +47,8 @@ suite_item_locations = set()
 suite_item_file_size_by_file = {}
 reporter = None
 tests_by_file = defaultdict(list)
+tests_by_class = defaultdict(list)
+tests_by_location = {}
 worker_id = None
 
 
@@ -47,14 +66,28 @@ def pytest_addoption(parser):
     workers_help = "Set the number of workers. Default is 1, to use all CPU cores set to 'max'."
     group.addoption('--w', '--workers', action='store', default=None, dest='workers', help=workers_help)
 
+    worker_mode_help = "Set how workers are run: 'thread' (default) or 'process' to fork one process per worker."
+    engine_help = "Set where tests are scheduled: 'remote' (default) or 'local' to schedule without a server."
+    group.addoption('--engine', action='store', default=None, dest='engine', choices=['remote', 'local'], help=engine_help)
+
+    group.addoption('--worker-mode', action='store', default=None, dest='worker_mode', choices=['thread', 'process'], help=worker_mode_help)
+
+    changed_since_help = 'Run tests affected by changes since this git revision first.'
+    group.addoption('--changed-since', action='store', default=None, dest='changed_since', help=changed_since_help)
+
+    changed_mode_help = "Set what to do with tests affected by changes: 'prioritize' (default) or 'only' run them."
+    group.addoption('--changed-mode', action='store', default=None, dest='changed_mode', choices=['prioritize', 'only'], help=changed_mode_help)
+
 
 @pytest.hookimpl(trylast=True)
 def pytest_configure(config):
-    global reporter, settings, fatal_error
+    global location_cache, reporter, settings, fatal_error
 
     settings = create_settings(config)
 
     if settings.enabled:
+        location_cache = LocationCache.open(config)
+
         if tuple(map(int, (pytest.__version__.split('.')))) < (3, 6, 0):
             system_exit('COULD NOT START', 'Sorry, pytest-conquer requires at least pytest 3.6.0.', {}, exit_fn=lambda: None)
             fatal_error = True
@@ -68,12 +101,16 @@ def create_settings(config):
     plugins = config.pluginmanager.list_plugin_distinfo()
     plugins.sort(key=lambda item: item[1].project_name)
     settings = Settings({
+        'changed_mode': config.option.changed_mode,
+        'changed_since': config.option.changed_since,
         'enabled': config.option.enabled,
+        'engine': config.option.engine,
         'runner_name': 'pytest',
         'runner_plugins': [(dist.project_name, dist.version) for plugin, dist in plugins],
         'runner_root': str(config.rootdir),
         'runner_version': pytest.__version__,
         'workers': config.option.workers,
+        'worker_mode': config.option.worker_mode,
     })
     settings.init_from_file('pytest.ini')
     return settings
@@ -85,7 +122,7 @@ def create_settings(config):
 
 
 def pytest_runtestloop(session):
-    global fatal_error
+    global fatal_error, history, local_engine, pinned_files
 
     if not settings.enabled:
         logger.info('conquer not enabled')
@@ -102,79 +139,407 @@ def pytest_runtestloop(session):
 
     print('conquer starting')
 
-    threads = []
+    history = History.open(session.config)
+    suite_cache.open(session.config)
+
+    if settings.changed_since:
+        select_changed(session, settings.changed_since, settings.changed_mode)
+    pinned_files = LocalEngine.pinned_files(suite_items)
+
     no_of_workers = settings.client_workers
-    for i in range(no_of_workers):
-        t = Worker(args=[session, settings])
-        threads.append(t)
-        t.start()
-    for t in threads:
-        t.join()
+    if settings.worker_mode == 'process' and supports_processes(session):
+        run_processes(session, no_of_workers)
+    else:
+        if settings.engine == 'local':
+            local_engine = LocalEngine(*local_engine_args(no_of_workers))
+        run_threads(session, no_of_workers)
+        if local_engine is not None:
+            logger.info('local engine: predicted completion by worker: %s', local_engine.predictions())
+        if history is not None:
+            history.save()
 
     return True
 
 
+def select_changed(session, base, mode):
+    global suite_items
+
+    changed_files = Git.changed_files(settings.runner_root, base)
+    if changed_files is None:
+        logger.warning('could not determine the files changed since %s', base)
+        return
+    affected = affected_tests(suite_items, changed_files)
+    logger.info('%s test(s) affected by %s changed file(s)', len(affected), len(changed_files))
+
+    if mode == 'only':
+        # walk all nodes, several can share a location (e.g. a test defined twice)
+        affected_keys = set((location.file, location.cls, location.func) for location in affected)
+        deselected = []
+        for file, nodes in list(tests_by_file.items()):
+            keys = [(node.__location__.file, node.__location__.cls, node.__location__.func) for node in nodes]
+            deselected.extend(node for node, key in zip(nodes, keys) if key not in affected_keys)
+            tests_by_file[file] = [node for node, key in zip(nodes, keys) if key in affected_keys]
+        deselected_ids = set(id(node) for node in deselected)
+        for key, nodes in list(tests_by_class.items()):
+            tests_by_class[key] = [node for node in nodes if id(node) not in deselected_ids]
+        for key in [key for key in tests_by_location if key not in affected_keys]:
+            del tests_by_location[key]
+        suite_items = [item for item in suite_items if item.type != 'test' or item.location in affected]
+        session.config.hook.pytest_deselected(items=deselected)
+    else:
+        suite_items = [item._replace(changed=True) if item.location in affected else item for item in suite_items]
+
+
+def run_threads(session, no_of_workers):
+    # when multiplexing, all workers share one network thread and one connection
+    shared = None
+    if settings.multiplex and settings.engine != 'local':
+        shared = Network('conquer-network')
+        shared.client = shared.call(create_shared_client())
+
+    threads = []
+    try:
+        for i in range(no_of_workers):
+            t = Worker(args=[session, settings, shared])
+            threads.append(t)
+            t.start()
+        if shared is not None:
+            # only connect once every worker subscribed, or they'd miss the server's first requests
+            for t in threads:
+                t.connected.wait()
+            shared.call(shared.client.start())
+        for t in threads:
+            t.join()
+    finally:
+        if shared is not None:
+            shared.call(shared.client.stop())
+            shared.close()
+
+
+async def create_shared_client():
+    client = Client(settings, multiplex=True)
+    client.subscribe(settings)
+    return client
+
+
+def supports_processes(session):
+    if 'fork' not in multiprocessing.get_all_start_methods():
+        logger.warning('process workers require fork, falling back to threads')
+        return False
+    if not hasattr(session.config.hook, 'pytest_report_from_serializable'):
+        logger.warning('process workers require pytest 4.4+, falling back to threads')
+        return False
+    return True
+
+
+def create_serializer():
+    if settings.location_table:
+        return CompactSerializer
+    return Serializer
+
+
+def local_engine_args(no_of_workers):
+    durations, fixture_costs, test_durations = None, None, None
+    if history is not None:
+        durations = history.file_durations()
+        test_durations = history.test_durations()
+        if settings.fixture_grouping:
+            threshold = settings.fixture_grouping_threshold / 1000
+            fixture_costs = {location: cost for location, cost in history.setup_durations().items() if cost >= threshold}
+    return suite_items, durations, fixture_costs, no_of_workers, test_durations, settings.split_limit
+
+
+class EngineManager(BaseManager):
+    pass
+
+
+EngineManager.register('LocalEngine', LocalEngine)
+
+
+def run_processes(session, no_of_workers):
+    global fatal_error, local_engine
+
+    # forking means the children inherit the collected session, no need to collect again
+    context = multiprocessing.get_context('fork')
+    results = context.Queue()
+    processes = []
+
+    # all children share one engine, served from a separate process
+    manager = None
+    if settings.engine == 'local':
+        manager = EngineManager(ctx=context)
+        manager.start()
+        local_engine = manager.LocalEngine(*local_engine_args(no_of_workers))
+    else:
+        suite_cache.share(context)
+        suite_cache.serialize(create_serializer(), suite_items)  # so the children don't have to
+
+    prepare_fork()
+    try:
+        for i in range(no_of_workers):
+            p = context.Process(target=run_process, args=[session, results], name=str(uuid.uuid4()))
+            processes.append(p)
+            p.start()
+    finally:
+        finish_fork()
+
+    # replay the children's results so the terminal and exit status reflect them
+    hook = session.config.hook
+    running = len(processes)
+    while running > 0:
+        try:
+            event = results.get(timeout=0.1)
+        except queue.Empty:
+            if not any(p.is_alive() for p in processes):
+                break  # a child died without saying goodbye
+            continue
+        kind, args = event
+        if kind == 'report':
+            hook.pytest_runtest_logreport(report=hook.pytest_report_from_serializable(config=session.config, data=args))
+        elif kind == 'logstart':
+            hook.pytest_runtest_logstart(nodeid=args[0], location=args[1])
+        elif kind == 'logfinish':
+            hook.pytest_runtest_logfinish(nodeid=args[0], location=args[1])
+        elif kind == 'exit':
+            running -= 1
+
+    for p in processes:
+        p.join()
+        if p.exitcode != 0:
+            fatal_error = True
+
+    if manager is not None:
+        logger.info('local engine: predicted completion by worker: %s', local_engine.predictions())
+        manager.shutdown()
+
+
+def prepare_fork():
+    # Collection is done by now, so all test items, fixtures and imported modules are
+    # in memory already. Moving them out of the GC's reach keeps the children from
+    # touching (and therefore copying) every page that holds a collected object.
+    gc.collect()
+    if hasattr(gc, 'freeze'):  # Python 3.7+
+        gc.freeze()
+
+
+def finish_fork():
+    if hasattr(gc, 'unfreeze'):  # Python 3.7+
+        gc.unfreeze()
+
+
+def run_process(session, results):
+    config = session.config
+
+    # the parent owns the terminal, this process only forwards results to it
+    capman = config.pluginmanager.getplugin('capturemanager')
+    if capman is not None:
+        capman.stop_global_capturing()
+        capman.start_global_capturing()
+    terminal = config.pluginmanager.getplugin('terminalreporter')
+    if terminal is not None:
+        config.pluginmanager.unregister(terminal)
+    config.pluginmanager.register(ResultForwarder(config, results))
+
+    try:
+        run_threads(session, 1)
+        if history is not None:
+            history.save()
+    finally:
+        results.put(('exit', None))
+        results.close()
+        results.join_thread()
+
+    if fatal_error:
+        sys.exit(3)
+
+
+class ResultForwarder:
+    def __init__(self, config, results):
+        self.config = config
+        self.results = results
+
+    def pytest_runtest_logstart(self, nodeid, location):
+        self.results.put(('logstart', (nodeid, location)))
+
+    def pytest_runtest_logreport(self, report):
+        self.results.put(('report', self.config.hook.pytest_report_to_serializable(config=self.config, report=report)))
+
+    def pytest_runtest_logfinish(self, nodeid, location):
+        self.results.put(('logfinish', (nodeid, location)))
+
+
+class Network:
+    """Runs an event loop on its own thread, so messages keep flowing while tests run."""
+
+    def __init__(self, name):
+        self.client = None
+        self.error = None
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.run, name=name, daemon=True)
+        self.thread.start()
+
+    def run(self):
+        asyncio.set_event_loop(self.loop)
+        try:
+            self.loop.run_forever()
+        except BaseException as err:  # e.g. SystemExit after a server error
+            self.error = err
+
+    def call(self, coro):
+        future = asyncio.run_coroutine_threadsafe(coro, self.loop)
+        while True:
+            try:
+                return future.result(timeout=0.1)
+            except concurrent.futures.TimeoutError:
+                if not self.thread.is_alive():
+                    future.cancel()
+                    raise self.error or RuntimeError('network thread stopped')
+
+    def close(self):
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+        self.loop.close()
+
+
 class Worker(threading.Thread):
     def __init__(self, *args, **kwargs):
         threading.Thread.__init__(self, name=str(uuid.uuid4()), *args, **kwargs)
         self.session = kwargs['args'][0]
         self.settings = kwargs['args'][1]
+        self.shared = kwargs['args'][2] if len(kwargs['args']) > 2 else None
+        self.network = None
+        self.scheduler = None
+        self.run_queue = RunQueue()
+        self.connected = threading.Event()
 
     def run(self):
         global fatal_error
         try:
-            loop = asyncio.new_event_loop()
-            loop.run_until_complete(self.run_task())
-            loop.close()
+            # the network gets its own thread so schedules keep arriving while tests run
+            self.network = self.shared or Network(self.name + '-network')
+            try:
+                self.run_task()
+            finally:
+                if self.network is not self.shared:
+                    self.network.close()
         except:  # noqa: E722
             fatal_error = True
             raise
+        finally:
+            self.connected.set()  # so nobody waits for a worker that failed
+
+    def call(self, coro):
+        return self.network.call(coro)
 
-    async def run_task(self):
-        global suite_items, schedulers, report_items_by_worker
+    async def connect(self):
+        global suite_items, schedulers
 
         # init client
-        client = Client(settings)
-        client.subscribe(self.settings)
+        if self.settings.engine == 'local':
+            client = LocalClient(settings, local_engine, self.name)
+            client.subscribe(self.settings)
+        elif self.shared is not None:
+            client = Channel(self.shared.client, self.name)  # settings are subscribed to the shared client already
+        else:
+            client = Client(settings)
+            client.subscribe(self.settings)
 
         # init scheduler
-        scheduler = Scheduler(self.settings, client, suite_items, self.name)
+        scheduler = Scheduler(self.settings, client, suite_items, self.name, create_serializer())
         schedulers.append(scheduler)
 
         # connect to server
         await client.start()
 
+        return client, scheduler
+
+    def run_task(self):
+        global report_items_by_worker
+
+        client, self.scheduler = self.call(self.connect())
+        self.connected.set()
+        scheduler = self.scheduler
+        stealing = self.settings.work_stealing
+
         # work through test items
-        next_tests = []
+        run_queue = self.run_queue
+        run_queues[self.name] = run_queue
         report_items_by_worker[self.name] = []
         while not scheduler.done:
-            pending_at = datetime.utcnow()
-            schedule = await scheduler.next()
-            if schedule is None:
-                break  # happens when we are done
-            started_at = datetime.utcnow()
-            schedule_files = [item.file for item in schedule.items]
-            schedule_tests = itertools.chain(*[tests_by_file[f] for f in schedule_files])
-            for test in schedule_tests:
-                test.__schedule_id__ = schedule.id
-                next_tests.append(test)
-            logger.info('preparing schedule took %sms', str(started_at - pending_at))
-
-            while next_tests:
-                if len(next_tests) < 2 and not scheduler.done:
-                    logger.info('requiring next schedule')
-                    break  # we don't know the next test yet
-                test = next_tests.pop(0)
-                next_test = next_tests[0] if next_tests else None
-                test.config.hook.pytest_runtest_protocol(item=test, nextitem=next_test)
-                if next_test is None or test.__schedule_id__ != next_test.__schedule_id__:
-                    report = Report(test.__schedule_id__, report_items_by_worker[self.name], pending_at, started_at, datetime.utcnow())
-                    await scheduler.report(report)
-                    report_items_by_worker[self.name] = []
+            held = False
+            if stealing and scheduler.schedule_queue.empty() and self.steal():
+                held = True  # nothing prefetched, so help a sibling; its schedule must not wait for one of ours
+            else:
+                pending_at = datetime.utcnow()
+                schedule = self.call(scheduler.next())  # only blocks if no schedule was prefetched
+                started_at = datetime.utcnow()
+                held = schedule is not None and schedule.id is None
+                if schedule is not None and not held:  # otherwise we are done, but still need to run what's left
+                    schedule_tests = []
+                    for item in schedule.items:
+                        for test in tests_for_schedule_item(item):
+                            test.__pinned__ = item.file in pinned_files  # grouped and singleton tests must not be stolen
+                            schedule_tests.append(test)
+                    key = (self.name, schedule.id)  # IDs are only unique per worker
+                    for test in schedule_tests:
+                        test.__schedule__ = key
+                    schedule_tracker.add(key, self, schedule_tests, pending_at, started_at)
+                    if not schedule_tests:
+                        self.finish(key, [], count=0)
+                    run_queue.extend(schedule_tests)
+                    logger.info('preparing schedule took %sms', str(started_at - pending_at))
+            self.run_tests(scheduler, held)
+
+        # help the siblings finish, then wait for them to finish what they took from us
+        while stealing and self.steal():
+            self.run_tests(scheduler)
+        del run_queues[self.name]
+        while not schedule_tracker.wait(self, timeout=1) and not fatal_error:
+            pass
 
         # wrap things up
-        await scheduler.stop()
-        await client.stop()
+        self.call(scheduler.stop())
+        self.call(client.stop())
+
+    def run_tests(self, scheduler, held=False):
+        run_queue = self.run_queue
+        while run_queue:
+            if len(run_queue) < 2 and not scheduler.done and not held:
+                logger.info('requiring next schedule')
+                break  # we don't know the next test yet
+            test = run_queue.pop()
+            if test is None:
+                break  # a sibling took it
+            next_test = run_queue.peek()
+            test.config.hook.pytest_runtest_protocol(item=test, nextitem=next_test)
+            items, report_items_by_worker[self.name] = report_items_by_worker[self.name], []
+            self.finish(test.__schedule__, items)
+
+    def finish(self, key, items, count=1):
+        # the report goes out through the worker that received the schedule, which isn't necessarily this one
+        owner = schedule_tracker.owner(key)
+        _, schedule_id = key
+        if self.settings.report_stream and items:
+            owner.call(owner.scheduler.stream(schedule_id, items))
+            items = []
+        schedule = schedule_tracker.complete(key, items, count)
+        if schedule is not None:
+            report = Report(schedule_id, schedule['items'], schedule['pending_at'], schedule['started_at'], datetime.utcnow())
+            owner.call(owner.scheduler.report(report))
+            schedule_tracker.release(key)  # only now the owner may shut down
+
+    def steal(self):
+        # take the second half of the longest queue of the other workers in this process
+        siblings = [q for name, q in list(run_queues.items()) if name != self.name]
+        victim = max(siblings, key=len, default=None)
+        if victim is None or len(victim) < 2:
+            return False
+        tests = victim.steal(stealable=lambda test: not getattr(test, '__pinned__', False))
+        if not tests:
+            return False
+        logger.info('took %s test(s) from a sibling', len(tests))
+        self.run_queue.extend(tests)
+        return True
 
 
 # report internal error properly
@@ -220,12 +585,18 @@ def pytest_collection_modifyitems(session, config, items):
     for node in items:
         collect_test(node)
 
+    if location_cache is not None:
+        location_cache.save()
+
 
 def collect_test(node):
     location = node_to_location(node)
     fixtures = collect_fixtures(node)
     collect_item(SuiteItem('test', location, deps=fixtures, tags=parse_tags(node.obj)))
     tests_by_file[location.file].append(node)
+    tests_by_class[(location.file, location.cls)].append(node)
+    tests_by_location[(location.file, location.cls, location.func)] = node
+    node.__location__ = location
 
 
 def collect_fixtures(node):
@@ -236,7 +607,8 @@ def collect_fixtures(node):
             location = func_to_location(fixture_fn)
             if is_artifical_fixture(fixturedef[0], location):
                 continue
-            fixtures.append(collect_item(SuiteItem('fixture', location, tags=parse_tags(fixture_fn))))
+            scope = fixturedef[0].scope if fixturedef[0].scope != 'function' else None  # function scope is the default
+            fixtures.append(collect_item(SuiteItem('fixture', location, scope=scope, tags=parse_tags(fixture_fn))))
     return fixtures
 
 
@@ -390,9 +762,21 @@ def collect_item(item):
     return item
 
 
+def tests_for_schedule_item(item):
+    if item.func is not None:  # a single test
+        test = tests_by_location.get((item.file, item.cls, item.func))
+        return [test] if test else []
+    if item.cls is not None:  # all tests of a class
+        return tests_by_class[(item.file, item.cls)]
+    return tests_by_file[item.file]
+
+
 def report_item(type, location, status, start, end, failure):
     worker_id = threading.current_thread().name
-    report_items_by_worker[worker_id].append(ReportItem(type, location, status, failure, start, end))
+    item = ReportItem(type, location, status, failure, start, end)
+    report_items_by_worker[worker_id].append(item)
+    if history is not None:
+        history.record(item)
 
 
 def node_to_location(node):
@@ -425,12 +809,24 @@ def func_to_location(func, obj=None):
     elif inspect.ismethod(obj):
         for cls in obj.__qualname__.split('.')[:-1][::-1]:
             classes.append(cls)
-    _, line = inspect.getsourcelines(func or obj)
+    line = cached_source_line(func or obj)
     cls = '.'.join(classes[::-1]) if classes else None
     module = inspect.getmodule(obj or func).__name__
     return Location(rel_file, module, cls, name, line)
 
 
+def cached_source_line(obj):
+    obj = inspect.unwrap(obj)
+    if location_cache is None or not inspect.isclass(obj) or '<locals>' in obj.__qualname__:
+        return source_line(obj)  # functions know their line already
+    path = inspect.getfile(obj)
+    line = location_cache.line(path, obj.__qualname__)
+    if line is None:
+        line = source_line(obj)
+        location_cache.store(path, obj.__qualname__, line)
+    return line
+
+
 def parse_tags(obj):
     marks = []
 
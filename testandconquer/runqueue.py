@@ -0,0 +1,101 @@
+import threading
+from collections import deque
+
+
+class RunQueue:
+    """The tests a worker is going to run next, in order.
+
+    Taking the next test and peeking at the one after it (pytest's `nextitem`)
+    are O(1). Tests can be put in front of the queue, either because they are
+    more urgent or because they have to be run again, and the queue is
+    thread-safe so that others can take tests off its end.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.tests = deque()
+
+    def extend(self, tests, priority=False):
+        with self.lock:
+            if priority:
+                self.tests.extendleft(reversed(list(tests)))
+            else:
+                self.tests.extend(tests)
+
+    def requeue(self, test):
+        with self.lock:
+            self.tests.appendleft(test)
+
+    def pop(self):
+        with self.lock:
+            return self.tests.popleft() if self.tests else None
+
+    def peek(self):
+        with self.lock:
+            return self.tests[0] if self.tests else None
+
+    def steal(self, stealable=None):
+        """Takes up to half of the tests off the end of the queue, returned in their original order.
+
+        The first test is never taken, the worker might already be using it as `nextitem`.
+        """
+        with self.lock:
+            count = len(self.tests) // 2
+            stolen = []
+            while len(self.tests) > 1 and len(stolen) < count:
+                if stealable is not None and not stealable(self.tests[-1]):
+                    break
+                stolen.append(self.tests.pop())
+            return stolen[::-1]
+
+    def __len__(self):
+        return len(self.tests)
+
+
+class ScheduleTracker:
+    """Keeps track of how many tests of each schedule are left to run.
+
+    A schedule is finished once its last test ran, no matter which worker
+    ran it, so the report can go out through the worker that received it.
+    """
+
+    def __init__(self):
+        self.changed = threading.Condition()
+        self.schedules = {}
+
+    def add(self, key, owner, tests, pending_at, started_at):
+        with self.changed:
+            self.schedules[key] = {
+                'owner': owner,
+                'left': len(tests),
+                'items': [],
+                'pending_at': pending_at,
+                'started_at': started_at,
+            }
+
+    def owner(self, key):
+        with self.changed:
+            return self.schedules[key]['owner']
+
+    def complete(self, key, items, count=1):
+        """Records the items of a test that ran; returns the schedule once it's finished.
+
+        A finished schedule is still tracked until it's released, so its owner keeps waiting for the report.
+        """
+        with self.changed:
+            schedule = self.schedules[key]
+            schedule['items'].extend(items)
+            schedule['left'] -= count
+            if schedule['left'] > 0:
+                return None
+            return schedule
+
+    def release(self, key):
+        with self.changed:
+            del self.schedules[key]
+            self.changed.notify_all()
+
+    def wait(self, owner, timeout=None):
+        """Blocks until other workers finished all tests they took from `owner`; returns False on timeout."""
+        with self.changed:
+            return self.changed.wait_for(lambda: all(s['owner'] is not owner for s in self.schedules.values()), timeout)
@@ -1,10 +1,133 @@
 import asyncio
+import hashlib
+import json
+import math
+import os
+import threading
+import time
 from contextlib import suppress
 
 from testandconquer import logger
 from testandconquer.client import MessageType
+from testandconquer.model import Schedule
 from testandconquer.serializer import Serializer
-from testandconquer.util import system_exit
+from testandconquer.util import ewma, system_exit
+
+
+PREFETCH_LIMIT = 8
+REPORT_QUEUE_LIMIT = 16
+REPORT_ITEM_OVERHEAD = 96  # roughly the keys and punctuation of an encoded report item
+
+
+def estimate_size(item):
+    # report items only nest their location and error, so this is close enough without encoding them twice
+    size = REPORT_ITEM_OVERHEAD
+    for value in item.values():
+        if isinstance(value, str):
+            size += len(value)
+        elif isinstance(value, dict):
+            size += sum(len(v) for v in value.values() if isinstance(v, str))
+    return size
+
+
+class SuiteCache:
+    """Serializes the suite once per process and lets only the first worker of a build node upload it."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.serializer = None
+        self.suite_items = None
+        self.data = None
+        self.hash = None
+        self.uploaded = False
+        self.shared_uploaded = None
+        self.path = None
+        self.previous = None
+
+    def open(self, config):
+        # remembers the last uploaded suite so the next build only needs to send what changed
+        cache = getattr(config, 'cache', None)
+        if cache is not None:
+            self.path = os.path.join(str(cache.makedir('conquer')), 'suite.json')
+
+    def share(self, context):
+        # lets forked worker processes agree on who uploads the suite
+        self.shared_uploaded = context.Value('b', 0)
+
+    def serialize(self, serializer, suite_items):
+        with self.lock:
+            if self.serializer is not serializer or self.suite_items is not suite_items:
+                self.serializer = serializer
+                self.suite_items = suite_items
+                self.data = serializer.serialize_suite(suite_items)
+                self.hash = hashlib.sha1(json.dumps(self.data, sort_keys=True).encode('utf-8')).hexdigest()
+                self.uploaded = False
+            return self.data, self.hash
+
+    def diff(self):
+        """Returns the changes since the previously uploaded suite, or None if they can't be expressed as a diff."""
+        with self.lock:
+            previous = self._load_previous()
+            if previous is None:
+                return None
+            if previous['hash'] == self.hash:  # the usual case on a branch
+                return {'hash': self.hash, 'base': previous['hash'], 'added': [], 'changed': [], 'removed': []}
+            old_items, new_items = SuiteCache.by_key(previous['items']), SuiteCache.by_key(self.data['items'])
+            if old_items is None or new_items is None:
+                return None
+            return {
+                'hash': self.hash,
+                'base': previous['hash'],
+                'added': [item for key, item in new_items.items() if key not in old_items],
+                'changed': [item for key, item in new_items.items() if key in old_items and old_items[key] != item],
+                'removed': [{'type': item['type'], 'location': item['location']} for key, item in old_items.items() if key not in new_items],
+            }
+
+    def remember(self):
+        with self.lock:
+            if self.path is None or (self.previous and self.previous['hash'] == self.hash):
+                return
+            self.previous = {'hash': self.hash, 'items': self.data['items']}
+            try:
+                with open(self.path + '.tmp', 'w') as f:
+                    json.dump(self.previous, f)
+                os.replace(self.path + '.tmp', self.path)  # other processes may be reading it
+            except OSError as err:
+                logger.warning('could not store suite: %s', err)
+
+    def _load_previous(self):
+        if self.previous is None and self.path is not None and os.path.exists(self.path):
+            try:
+                with open(self.path) as f:
+                    self.previous = json.load(f)
+            except (OSError, ValueError) as err:
+                logger.warning('could not read previous suite: %s', err)
+        return self.previous
+
+    @staticmethod
+    def by_key(items):
+        by_key = {}
+        for item in items:
+            location = item['location']
+            if not isinstance(location, dict):
+                return None  # refers to a location table, which isn't stable across builds
+            key = json.dumps([item['type'], {k: v for k, v in location.items() if k != 'line'}], sort_keys=True)
+            if key in by_key:
+                return None
+            by_key[key] = item
+        return by_key
+
+    def claim_upload(self):
+        with self.lock:
+            if self.shared_uploaded is not None:
+                with self.shared_uploaded.get_lock():
+                    first, self.shared_uploaded.value = not self.shared_uploaded.value, 1
+                    return first
+            first, self.uploaded = not self.uploaded, True
+            return first
+
+
+suite_cache = SuiteCache()
 
 
 class Scheduler:
@@ -16,9 +139,23 @@ class Scheduler:
         self.serializer = serializer
 
         self.more = True
+        self.prefetch = settings.prefetch
+        self.round_trip = None
+        self.schedule_duration = None
+        self.reported_at = None
         self.schedule_queue = asyncio.Queue()
-        self.report_queue = asyncio.Queue()
-        self.task = asyncio.ensure_future(self._report_task())
+        self.report_queue = asyncio.Queue(REPORT_QUEUE_LIMIT)  # a worker waits for room before finishing its schedule
+
+        self.stream_reports = settings.report_stream
+        self.batch_bytes_limit = settings.report_batch_bytes
+        self.batch_interval = settings.report_batch_interval / 1000
+        self.batch_items_limit = settings.report_batch_items
+        self.batch = []
+        self.batch_acks = []
+        self.batch_bytes = 0
+        self.batch_started = None
+
+        self.task = asyncio.ensure_future(self._flush_task() if self.stream_reports else self._report_task())
         client.subscribe(self)
 
     async def next(self):
@@ -26,12 +163,41 @@ class Scheduler:
 
     async def report(self, report):
         logger.info('acking schedule %s', report.schedule_id)
-        await self.client.send(MessageType.Ack, {'schedule_id': report.schedule_id, 'status': 'success'})
+        ack = {'schedule_id': report.schedule_id, 'status': 'success'}
+        if self.prefetch == 'auto':
+            if report.started_at and report.finished_at:
+                duration = (report.finished_at - report.started_at).total_seconds()
+                self.schedule_duration = ewma(self.schedule_duration, duration)
+            ack['prefetch'] = self.prefetch_window
+        self.reported_at = time.time()
+        if self.stream_reports:
+            await self.stream(report.schedule_id, report.items)
+            ack.update(self.serializer.serialize_report_timings(report))
+            self._add_to_batch(acks=[ack])
+            if self.schedule_queue.empty():
+                await self.flush()  # the worker is about to wait for its next schedule
+            return
+        await self.client.send(MessageType.Ack, ack)
         logger.info('submitting report with %s item(s)', len(report.items))
         await self.report_queue.put(report)
 
+    async def stream(self, schedule_id, report_items):
+        items = [self.serializer.serialize_report_item(schedule_id, i) for i in report_items]
+        self._add_to_batch(items=items)
+        if len(self.batch) >= self.batch_items_limit or self.batch_bytes >= self.batch_bytes_limit:
+            await self.flush()
+
+    async def flush(self):
+        if not self.batch and not self.batch_acks:
+            return
+        payload = {'items': self.batch, 'acks': self.batch_acks}
+        logger.info('sending %s completed item(s) and %s ack(s)', len(self.batch), len(self.batch_acks))
+        self.batch, self.batch_acks, self.batch_bytes, self.batch_started = [], [], 0, None
+        await self.client.send(MessageType.Report, payload)
+
     async def stop(self):
         await self.report_queue.join()
+        await self.flush()
         self.task.cancel()
         with suppress(asyncio.CancelledError):
             await self.task
@@ -42,10 +208,29 @@ class Scheduler:
             logger.info('generated config: %s', config_data)
             await self.client.send(MessageType.Config, config_data)
         elif message_type == MessageType.Suite.value:
-            suite_data = self.serializer.serialize_suite(self.suite_items)
-            logger.info('initialising suite with %s item(s)', len(self.suite_items))
-            await self.client.send(MessageType.Suite, suite_data)
+            suite_data, suite_hash = suite_cache.serialize(self.serializer, self.suite_items)
+            full = (payload or {}).get('full')
+            if suite_cache.claim_upload() or full:
+                diff = suite_cache.diff() if self.settings.suite_diff and not full else None
+                if diff is not None:
+                    logger.info('updating suite with %s added, %s changed and %s removed item(s)',
+                                len(diff['added']), len(diff['changed']), len(diff['removed']))
+                    await self.client.send(MessageType.Suite, diff)
+                else:
+                    logger.info('initialising suite with %s item(s)', len(self.suite_items))
+                    await self.client.send(MessageType.Suite, dict(suite_data, hash=suite_hash))
+                suite_cache.remember()
+            else:
+                logger.info('referring to suite %s', suite_hash)  # another worker on this node uploaded it already
+                await self.client.send(MessageType.Suite, {'hash': suite_hash})
+        elif message_type == MessageType.Schedules.value and not payload:
+            if self.schedule_queue.empty():  # otherwise the worker isn't waiting anyway
+                logger.info('received no schedules for now')
+                await self.schedule_queue.put(Schedule(None, []))  # so the worker finishes what it has instead of waiting
         elif message_type == MessageType.Schedules.value:
+            if self.reported_at is not None:
+                self.round_trip = ewma(self.round_trip, time.time() - self.reported_at)
+                self.reported_at = None
             for schedule_data in payload:
                 schedule = self.serializer.deserialize_schedule(schedule_data)
                 logger.info('received schedule with %s item(s)', len(schedule.items))
@@ -68,6 +253,36 @@ class Scheduler:
             except asyncio.CancelledError:
                 break
 
+    async def _flush_task(self):
+        logger.info('initialising report flush task')
+        while True:
+            try:
+                waited = time.time() - self.batch_started if self.batch_started else 0
+                await asyncio.sleep(max(0, self.batch_interval - waited))
+                if self.batch_started and time.time() - self.batch_started >= self.batch_interval:
+                    await self.flush()
+            except asyncio.CancelledError:
+                break
+
+    def _add_to_batch(self, items=(), acks=()):
+        if not items and not acks:
+            return
+        if self.batch_started is None:
+            self.batch_started = time.time()
+        for item in items:
+            self.batch_bytes += estimate_size(item)
+        self.batch.extend(items)
+        self.batch_acks.extend(acks)
+
+    @property
+    def prefetch_window(self):
+        if self.prefetch != 'auto':
+            return self.prefetch
+        if not self.round_trip or not self.schedule_duration:
+            return 1
+        # keep enough schedules in flight to cover a full round-trip to the server
+        return max(1, min(PREFETCH_LIMIT, 1 + math.ceil(self.round_trip / self.schedule_duration)))
+
     @property
     def done(self):
-        return self.schedule_queue.empty and not self.more
+        return self.schedule_queue.empty() and not self.more
@@ -1,3 +1,5 @@
+import threading
+
 from testandconquer import logger
 from testandconquer.client import MessageType
 from testandconquer.model import Schedule, ScheduleItem
@@ -20,6 +22,14 @@ class Serializer:
     def serialize_report(*args, **kwargs):
         return ReportSerializer.serialize(*args, **kwargs)
 
+    @staticmethod
+    def serialize_report_item(schedule_id, item):
+        return dict(ReportSerializer.serialize_item(item), schedule_id=schedule_id)
+
+    @staticmethod
+    def serialize_report_timings(*args, **kwargs):
+        return ReportSerializer.serialize_timings(*args, **kwargs)
+
     @staticmethod
     def deserialize_schedule(*args, **kwargs):
         return ScheduleSerializer.deserialize(*args, **kwargs)
@@ -31,6 +41,45 @@ class Serializer:
         return data[:max_size]
 
 
+class CompactSerializer(Serializer):
+    """Sends every location once with the suite; later messages refer to it by its index."""
+
+    locations = None
+
+    @staticmethod
+    def serialize_suite(suite_items):
+        CompactSerializer.locations = LocationTable()
+        return SuiteSerializer.serialize(suite_items, CompactSerializer.locations)
+
+    @staticmethod
+    def serialize_report(report):
+        return ReportSerializer.serialize(report, CompactSerializer.locations)
+
+    @staticmethod
+    def serialize_report_item(schedule_id, item):
+        return dict(ReportSerializer.serialize_item(item, CompactSerializer.locations), schedule_id=schedule_id)
+
+
+class LocationTable:
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.ids = {}
+        self.data = []
+
+    def add(self, location):
+        with self.lock:
+            id = self.ids.get(location)
+            if id is None:
+                id = len(self.data)
+                self.ids[location] = id
+                self.data.append(LocationSerializer.serialize(location))
+            return id
+
+    def get(self, location):
+        return self.ids.get(location)
+
+
 class ConfigSerializer:
 
     @staticmethod
@@ -49,6 +98,8 @@ class ConfigSerializer:
                 'capabilities': [c.value for c in Capability],
                 'messages': [t.value for t in MessageType],
                 'name': Serializer.truncate(settings.client_name, 64),
+                'prefetch': settings.prefetch,
+                'split_limit': settings.split_limit,
                 'version': Serializer.truncate(settings.client_version, 32),
                 'workers': settings.client_workers,
                 'worker_id': worker_id,
@@ -90,23 +141,26 @@ class ConfigSerializer:
 class SuiteSerializer:
 
     @staticmethod
-    def serialize(suite_items):
-        return {
-            'items': [SuiteSerializer.serialize_item(i) for i in suite_items],
-        }
+    def serialize(suite_items, locations=None):
+        items = [SuiteSerializer.serialize_item(i, locations) for i in suite_items]
+        if locations is None:
+            return {'items': items}
+        return {'locations': locations.data, 'items': items}
 
     @staticmethod
-    def serialize_item(item):
+    def serialize_item(item, locations=None):
         data = {
             'type': item.type,
-            'location': LocationSerializer.serialize(item.location),
+            'location': LocationSerializer.serialize_ref(item.location, locations, add=True),
         }
         if item.size:
             data['file_size'] = item.size
         if item.tags:
             data['tags'] = [SuiteSerializer.serialize_tag(t) for t in item.tags]
         if item.deps:
-            data['deps'] = [SuiteSerializer.serialize_fixture_ref(f) for f in item.deps]
+            data['deps'] = [SuiteSerializer.serialize_fixture_ref(f, locations) for f in item.deps]
+        if item.changed:
+            data['changed'] = True
         return data
 
     @staticmethod
@@ -119,30 +173,37 @@ class SuiteSerializer:
         return data
 
     @staticmethod
-    def serialize_fixture_ref(item):
+    def serialize_fixture_ref(item, locations=None):
         return {
             'type': item.type,
-            'location': LocationSerializer.serialize(item.location),
+            'location': LocationSerializer.serialize_ref(item.location, locations, add=True),
         }
 
 
 class ReportSerializer:
 
     @staticmethod
-    def serialize(report):
-        return {
+    def serialize(report, locations=None):
+        data = {
             'schedule_id': report.schedule_id,
-            'items': [ReportSerializer.serialize_item(i) for i in report.items],
+            'items': [ReportSerializer.serialize_item(i, locations) for i in report.items],
+        }
+        data.update(ReportSerializer.serialize_timings(report))
+        return data
+
+    @staticmethod
+    def serialize_timings(report):
+        return {
             'pending_at': report.pending_at.strftime(Serializer.date_format),
             'started_at': report.started_at.strftime(Serializer.date_format),
             'finished_at': report.finished_at.strftime(Serializer.date_format),
         }
 
     @staticmethod
-    def serialize_item(item):
+    def serialize_item(item, locations=None):
         data = {
             'type': str(item.type),
-            'location': LocationSerializer.serialize(item.location),
+            'location': LocationSerializer.serialize_ref(item.location, locations),
             'status': item.status,
         }
         if item.started_at:
@@ -162,7 +223,7 @@ class ScheduleSerializer:
 
     @staticmethod
     def deserialize(data):
-        items = [ScheduleItem(item['file']) for item in data['items']]
+        items = [ScheduleItem(item['file'], item.get('class'), item.get('func')) for item in data['items']]
         logger.info('received schedule with %s items', len(items))
         return Schedule(data['id'], items)
 
@@ -182,3 +243,11 @@ class LocationSerializer:
         if item.line:
             data['line'] = item.line
         return data
+
+    @staticmethod
+    def serialize_ref(item, locations, add=False):
+        if locations is not None:
+            id = locations.add(item) if add else locations.get(item)
+            if id is not None:
+                return id
+        return LocationSerializer.serialize(item)  # not part of the table, send it in full
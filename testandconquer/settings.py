@@ -18,14 +18,22 @@ ENV_PREFIX = 'CONQUER_'
 
 
 class Capability(Enum):
+    ChangedTests = 'changed_tests'
     Fixtures = 'fixtures'
     LifecycleTimings = 'lifecycle_timings'
+    LocationTable = 'location_table'
+    ReportStream = 'report_stream'
     SplitByFile = 'split_by_file'
+    SplitByTest = 'split_by_test'
+    SuiteDiff = 'suite_diff'
+    SuiteHash = 'suite_hash'
 
 
 class Settings():
     def __init__(self, args):
         self.args = args
+        self.cache = {}  # resolved values by name, cleared whenever a source changes
+        self.defaults = {}  # default values by name, they don't depend on any source
         self.config_file = None
         self.mapping = None
         self.static_settings = StaticSettings()
@@ -41,6 +49,7 @@ class Settings():
     def init_from_file(self, path):
         self.config_file = configparser.ConfigParser()
         self.config_file.read(path)  # ignores non-existing file
+        self.cache.clear()
 
         if self.config_file.has_section(CONFIG_SECTION):
             for key in self.config_file[CONFIG_SECTION]:
@@ -56,6 +65,7 @@ class Settings():
             return (MessageType.Envs, self.args['system_provider'])
 
     def _init_mapping(self, envs):
+        self.cache.clear()
         is_match = False
         for env in envs:
             for condition in env['conditions']:
@@ -80,11 +90,14 @@ class Settings():
         return val
 
     def __getattr__(self, name):
-        default_val = None
-        default_method = getattr(self.default_settings, name, None)
-        if default_method:
-            default_val = default_method()
+        if name not in self.cache:
+            self.cache[name] = self._resolve(name)
+        val = self.cache[name]
+        if isinstance(val, Exception):
+            raise val
+        return val
 
+    def _resolve(self, name):
         # 1) static values (can't be overriden)
         method = getattr(self.static_settings, name, None)
         if method:
@@ -93,16 +106,16 @@ class Settings():
         # 2) plugin arguments
         arg_val = self.args.get(name, None)
         if arg_val is not None:
-            return self._convert(arg_val, default_val)
+            return self._convert(arg_val, name)
 
         # 3) environment variables
         env_name = name.upper()
         if env_name in self.upcased_environ:
-            return self._convert(self.upcased_environ[env_name], default_val)
+            return self._convert(self.upcased_environ[env_name], name)
 
         # 4) local config file
         if self.config_file and self.config_file.has_option(CONFIG_SECTION, name):
-            return self._convert(self.config_file.get(CONFIG_SECTION, name), default_val)
+            return self._convert(self.config_file.get(CONFIG_SECTION, name), name)
 
         # 5) provider variables
         mapping_name = name.upper()
@@ -110,7 +123,7 @@ class Settings():
             val = self.mapping[mapping_name]
             if val:
                 if isinstance(val, str) and val.upper() in self.upcased_environ:
-                    return self._convert(self.upcased_environ[val.upper()], default_val)
+                    return self._convert(self.upcased_environ[val.upper()], name)
                 elif isinstance(val, list):
                     res = {}
                     for key in val:
@@ -119,14 +132,22 @@ class Settings():
                     return res
 
         # 6) defaults
-        if isinstance(default_val, Exception):
-            raise default_val
-        return default_val
-
-    def _convert(self, val, default_val):
-        if isinstance(val, str) and isinstance(default_val, int) and val.isdigit():
+        return self._default(name)
+
+    def _default(self, name):
+        # only called when needed, and only once, since some defaults shell out to git
+        if name not in self.defaults:
+            default_method = getattr(self.default_settings, name, None)
+            self.defaults[name] = default_method() if default_method else None
+        return self.defaults[name]
+
+    def _convert(self, val, name):
+        if not isinstance(val, str):
+            return val
+        default_val = self._default(name)
+        if isinstance(default_val, int) and val.isdigit():
             return int(val)
-        if isinstance(val, str) and isinstance(default_val, bool):
+        if isinstance(default_val, bool):
             return val.lower() == 'true'
         return val
 
@@ -193,12 +214,78 @@ class DefaultSettings():
     def build_pool(self):
         return 0
 
+    def changed_mode(self):
+        return 'prioritize'
+
+    def changed_since(self):
+        return None
+
+    def compression(self):
+        return True
+
+    def compression_mem_level(self):
+        return 8
+
+    def compression_threshold(self):
+        return 256
+
+    def compression_window_bits(self):
+        return 15
+
     def debug(self):
         return False
 
     def enabled(self):
         return False
 
+    def engine(self):
+        return 'remote'
+
+    def fixture_grouping(self):
+        return False
+
+    def fixture_grouping_threshold(self):
+        return 500  # milliseconds
+
+    def location_table(self):
+        return False
+
+    def message_format(self):
+        return 'json'
+
+    def multiplex(self):
+        return False
+
+    def prefetch(self):
+        return 1
+
+    def replay_limit(self):
+        return 1000
+
+    def report_batch_bytes(self):
+        return 65536
+
+    def report_batch_interval(self):
+        return 1000  # milliseconds
+
+    def report_batch_items(self):
+        return 100
+
+    def report_stream(self):
+        return False
+
+    def send_queue_limit(self):
+        return 1000
+
+    def send_queue_spill(self):
+        return 'block'
+
+    def split_limit(self):
+        return 4
+
+    def suite_diff(self):
+        return False
+
     def system_context(self):
         return {}
 
@@ -226,5 +313,11 @@ class DefaultSettings():
     def vcs_type(self):
         return 'git'
 
+    def work_stealing(self):
+        return False
+
+    def worker_mode(self):
+        return 'thread'
+
     def workers(self):
         return 1
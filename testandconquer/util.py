@@ -4,6 +4,12 @@ from datetime import datetime
 from testandconquer import logger
 
 
+def ewma(average, sample, weight=0.3):
+    if average is None:
+        return sample
+    return weight * sample + (1 - weight) * average
+
+
 def system_exit(title, body, args, exit_fn=lambda: exec('raise SystemExit')):
     args['Timestamp'] = datetime.utcnow().isoformat()
     meta = ['[{} = {}]'.format(key, val) for (key, val) in args.items()]
@@ -289,9 +289,9 @@ def test_fixture_session(testdir):
     assert scheduler.suite_items == [
         SuiteItem('file', Location('fixtures/conftest.py'), size=42),
         SuiteItem('file', Location(test_file), size=42),
-        SuiteItem('fixture', Location('fixtures/conftest.py', 'conftest', None, 'fixture_session', 4)),
+        SuiteItem('fixture', Location('fixtures/conftest.py', 'conftest', None, 'fixture_session', 4), scope='session'),
         SuiteItem('test', Location(test_file, module_for(test_file), None, 'test_with_fixture', 1), deps=[
-            SuiteItem('fixture', Location('fixtures/conftest.py', 'conftest', None, 'fixture_session', 4)),
+            SuiteItem('fixture', Location('fixtures/conftest.py', 'conftest', None, 'fixture_session', 4), scope='session'),
         ]),
     ]
 
@@ -618,6 +618,14 @@ def test_disabled_plugin(testdir):
     assert scheduler is None
 
 
+def test_process_workers(testdir):
+    test_files = ['fixtures/test_function_pass.py', 'fixtures/test_function_fail.py', 'fixtures/test_class_multi.py']
+    (result, scheduler) = run_test(testdir, test_files, ['--conquer', '--worker-mode', 'process'])
+    assert_outcomes(result, passed=3, failed=1)
+
+    assert scheduler is None  # schedulers live in the child processes
+
+
 def test_settings(testdir):
     run_test(testdir, ['fixtures/test_class.py'])
 
@@ -10,6 +10,7 @@ from datetime import datetime, timezone
 
 import psutil
 import pytest
+from unittest import mock
 
 from testandconquer.client import Client, MessageType
 from testandconquer.scheduler import Scheduler
@@ -75,9 +76,9 @@ async def test_successful_server_communication(config, mock_server):
         (MessageType.Config.value, {
             'build': {'dir': '/app', 'id': config['build']['id'], 'job': 'job', 'node': 'random-uuid', 'pool': 0, 'project': None, 'url': None},
             'client': {
-                'capabilities': ['fixtures', 'lifecycle_timings', 'split_by_file'],
+                'capabilities': ['changed_tests', 'fixtures', 'lifecycle_timings', 'location_table', 'report_stream', 'split_by_file', 'split_by_test', 'suite_diff', 'suite_hash'],
                 'messages': ['ack', 'config', 'done', 'envs', 'error', 'report', 'schedules', 'suite'],
-                'name': 'pytest-conquer', 'version': '1.0', 'workers': 1, 'worker_id': 'my_worker_id',
+                'name': 'pytest-conquer', 'prefetch': 1, 'split_limit': 4, 'version': '1.0', 'workers': 1, 'worker_id': 'my_worker_id',
             },
             'platform': {'name': 'python', 'version': '3.6'},
             'runner': {'args': ['arg1'], 'name': None, 'plugins': [], 'root': None, 'version': None},
@@ -101,6 +102,7 @@ async def test_successful_server_communication(config, mock_server):
                 {'type': 'test', 'location': {'file': 'tests/IT/stub/stub_C.py', 'func': 'test_C', 'module': 'stub_C', 'class': 'TestClass', 'line': 1},
                     'deps': [{'type': 'fixture', 'location': {'file': 'tests/IT/stub/stub_fixture.py', 'func': 'test_C', 'module': 'fixtures', 'class': 'FixtureClass'}}]},
             ],
+            'hash': mock.ANY,
         }),
         (MessageType.Ack.value, {'message_num': 2, 'status': 'success'}),
     ])
@@ -161,7 +163,7 @@ async def test_successful_server_communication(config, mock_server):
     await mock_server.send(MessageType.Schedules, [{
         'id': '1',
         'items': [
-            {'file': 'tests/IT/stub/stub_C.py'},
+            {'file': 'tests/IT/stub/stub_C.py', 'class': 'TestClass', 'func': 'test_C'},
         ],
     }])
 
@@ -170,7 +172,7 @@ async def test_successful_server_communication(config, mock_server):
     ])
 
     assert await scheduler.next() == Schedule('1', [
-        ScheduleItem('tests/IT/stub/stub_C.py'),
+        ScheduleItem('tests/IT/stub/stub_C.py', 'TestClass', 'test_C'),
     ])
 
     # (12) CLIENT SENDS REPORT #2
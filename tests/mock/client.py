@@ -13,5 +13,5 @@ class MockClient(Client):
     async def stop(self):
         pass
 
-    async def send(self, type, payload):
+    async def send(self, type, payload, worker_id=None):
         self.received.append((type, payload))
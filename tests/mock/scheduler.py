@@ -9,7 +9,7 @@ synchronization = dict(manager=manager)
 
 
 class MockScheduler():
-    def __init__(self, settings, client, suite_items, worker_id):
+    def __init__(self, settings, client, suite_items, worker_id, serializer=None):
         self.done = False
         self.settings = settings
         self._suite_items = suite_items
@@ -34,6 +34,10 @@ class MockScheduler():
         with synchronization['lock']:
             self._report_items.extend(report.items)
 
+    async def stream(self, schedule_id, report_items):
+        with synchronization['lock']:
+            self._report_items.extend(report_items)
+
     @property
     def suite_items(self):
         return self.__sorted(self.__fixed_suite(self._suite_items))
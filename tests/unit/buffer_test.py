@@ -0,0 +1,78 @@
+import asyncio
+
+import pytest
+
+from testandconquer.buffer import ReplayBuffer, SendBuffer
+
+
+@pytest.mark.asyncio()
+async def test_block_when_full():
+    buffer = SendBuffer(2)
+    await buffer.put({'num': 0})
+    await buffer.put({'num': 1})
+
+    put = asyncio.ensure_future(buffer.put({'num': 2}))
+    await asyncio.sleep(0.01)
+    assert not put.done()  # waits for room
+
+    assert await buffer.get() == {'num': 0}
+    await asyncio.sleep(0.01)
+    assert put.done()
+    assert await buffer.get() == {'num': 1}
+    assert await buffer.get() == {'num': 2}
+    assert buffer.file is None
+
+
+@pytest.mark.asyncio()
+async def test_spill_to_disk_when_full():
+    buffer = SendBuffer(2, 'disk')
+    for num in range(5):
+        await buffer.put({'num': num})
+    assert buffer.qsize() == 5
+    assert buffer.spilled == 3
+
+    assert [(await buffer.get())['num'] for _ in range(3)] == [0, 1, 2]
+    await buffer.put({'num': 5})  # goes behind the spilled messages
+    assert [(await buffer.get())['num'] for _ in range(3)] == [3, 4, 5]
+    assert buffer.empty()
+    assert buffer.file.tell() == 0  # truncated once drained
+
+
+@pytest.mark.asyncio()
+async def test_join():
+    buffer = SendBuffer(10)
+    await buffer.put({'num': 0})
+
+    join = asyncio.ensure_future(buffer.join())
+    await buffer.get()
+    await asyncio.sleep(0.01)
+    assert not join.done()
+
+    buffer.task_done()
+    await asyncio.sleep(0.01)
+    assert join.done()
+
+
+def test_invalid_spill_policy():
+    with pytest.raises(ValueError, match="invalid spill policy 'swap'"):
+        SendBuffer(10, 'swap')
+
+
+def test_replay_unacked_messages():
+    buffer = ReplayBuffer(10)
+    for num in range(5):
+        buffer.add({'num': num})
+
+    buffer.ack(1)
+    assert len(buffer) == 3
+    assert [m['num'] for m in buffer.since(2)] == [3, 4]
+    assert buffer.since(4) == []
+
+
+def test_replay_evicted_messages():
+    buffer = ReplayBuffer(2)
+    for num in range(5):
+        buffer.add({'num': num})
+
+    assert buffer.since(1) is None  # message 2 is gone
+    assert [m['num'] for m in buffer.since(2)] == [3, 4]
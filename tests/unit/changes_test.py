@@ -0,0 +1,19 @@
+from testandconquer.changes import affected_tests
+from testandconquer.model import Location, SuiteItem
+
+
+def test_affected_tests():
+    fixture = SuiteItem('fixture', Location('conftest.py', 'conftest', None, 'db', 1))
+    suite_items = [
+        SuiteItem('file', Location('test_a.py')),
+        SuiteItem('test', Location('test_a.py', 'test_a', None, 'test_1', 1)),
+        SuiteItem('test', Location('test_b.py', 'test_b', None, 'test_2', 1)),
+        SuiteItem('test', Location('test_c.py', 'test_c', None, 'test_3', 1), deps=[fixture]),
+        fixture,
+    ]
+
+    assert affected_tests(suite_items, {'test_a.py', 'conftest.py'}) == {
+        Location('test_a.py', 'test_a', None, 'test_1', 1),
+        Location('test_c.py', 'test_c', None, 'test_3', 1),
+    }
+    assert affected_tests(suite_items, set()) == set()
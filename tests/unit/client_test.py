@@ -0,0 +1,93 @@
+import json
+
+import pytest
+
+from testandconquer.client import Channel, Client, MessageFormat, MessageType
+
+from tests.mock.client import MockClient
+from tests.mock.settings import MockSettings
+
+
+def test_encode():
+    message = json.loads(Client.encode(1, MessageType.Ack, {'status': 'success'}))
+    assert message['num'] == 1
+    assert message['type'] == 'ack'
+    assert message['payload'] == {'status': 'success'}
+    assert 'worker_id' not in message
+
+
+def test_encode_with_worker_id():
+    message = json.loads(Client.encode(1, MessageType.Ack, {'status': 'success'}, 'my_worker_id'))
+    assert message['worker_id'] == 'my_worker_id'
+
+
+def test_encode_message_pack():
+    raw_message = Client.encode(1, MessageType.Ack, {'status': 'success'}, message_format=MessageFormat.MessagePack)
+    assert isinstance(raw_message, bytes)
+
+    message = Client.decode(raw_message)
+    assert message['num'] == 1
+    assert message['type'] == 'ack'
+    assert message['payload'] == {'status': 'success'}
+
+
+def test_message_formats():
+    assert Client.to_message_formats('json') == [MessageFormat.JSON]
+    assert Client.to_message_formats('msgpack') == [MessageFormat.MessagePack, MessageFormat.JSON]
+
+
+def test_negotiate_message_format():
+    offered = [MessageFormat.MessagePack, MessageFormat.JSON]
+    assert Client.negotiate('msgpack', offered) == MessageFormat.MessagePack
+    assert Client.negotiate('json', offered) == MessageFormat.JSON
+    assert Client.negotiate(None, offered) == MessageFormat.JSON  # server doesn't know about formats
+    assert Client.negotiate('msgpack', [MessageFormat.JSON]) == MessageFormat.JSON
+
+
+@pytest.mark.asyncio()
+async def test_channel():
+    class SharedClient(MockClient):
+        async def send(self, type, payload, worker_id=None):
+            self.received.append((type, payload, worker_id))
+
+    client = SharedClient(MockSettings({}))
+    channel = Channel(client, 'my_worker_id')
+    subscriber = object()
+
+    channel.subscribe(subscriber)
+    await channel.send(MessageType.Ack, 'some-payload')
+
+    assert client.subscribers == [(subscriber, 'my_worker_id')]
+    assert client.received == [(MessageType.Ack, 'some-payload', 'my_worker_id')]
+
+
+@pytest.mark.asyncio()
+async def test_deliver_to_targeted_worker():
+    class Subscriber:
+        def __init__(self, reply=None):
+            self.received = []
+            self.reply = reply
+
+        async def on_server_message(self, message_type, payload):
+            self.received.append((message_type, payload))
+            return self.reply
+
+    client = Client(MockSettings({}), multiplex=True)
+    sent = []
+
+    async def send(message_type, payload, worker_id=None):
+        sent.append((message_type, payload, worker_id))
+    client.send = send
+
+    everyone, worker_1, worker_2 = Subscriber(), Subscriber((MessageType.Config, 'config-1')), Subscriber()
+    client.subscribe(everyone)
+    client.subscribe(worker_1, 'w1')
+    client.subscribe(worker_2, 'w2')
+
+    await client._deliver({'type': 'CONFIG', 'payload': 'for-w1', 'worker_id': 'w1'})
+    await client._deliver({'type': 'ENVS', 'payload': 'for-all'})
+
+    assert everyone.received == [('config', 'for-w1'), ('envs', 'for-all')]
+    assert worker_1.received == [('config', 'for-w1'), ('envs', 'for-all')]
+    assert worker_2.received == [('envs', 'for-all')]
+    assert sent == [(MessageType.Config, 'config-1', 'w1'), (MessageType.Config, 'config-1', 'w1')]
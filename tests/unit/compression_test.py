@@ -0,0 +1,38 @@
+from testandconquer.compression import CompressionFactory, ThresholdPerMessageDeflate
+from testandconquer.vendor.websockets.extensions.permessage_deflate import PerMessageDeflate
+from testandconquer.vendor.websockets.framing import OP_TEXT, Frame
+
+from tests.mock.settings import MockSettings
+
+
+def test_skip_compression_below_threshold():
+    extension = ThresholdPerMessageDeflate(100, False, False, 15, 15)
+
+    frame = Frame(True, OP_TEXT, b'{"type": "ack"}')
+    assert extension.encode(frame) == frame
+
+
+def test_compress_above_threshold():
+    extension = ThresholdPerMessageDeflate(100, False, False, 15, 15)
+    decoder = PerMessageDeflate(False, False, 15, 15)
+
+    data = b'{"file": "tests/test_a.py"}' * 10
+    encoded = extension.encode(Frame(True, OP_TEXT, data))
+    assert encoded.rsv1 is True
+    assert len(encoded.data) < len(data)
+    assert decoder.decode(encoded).data == data
+
+
+def test_factory_from_settings():
+    factory = CompressionFactory.from_settings(MockSettings({'compression_mem_level': '4', 'compression_window_bits': '12'}))
+    assert factory.threshold == 256
+    assert factory.client_max_window_bits == 12
+    assert factory.compress_settings == {'memLevel': 4}
+
+    extension = factory.process_response_params([], [])
+    assert isinstance(extension, ThresholdPerMessageDeflate)
+    assert extension.local_max_window_bits == 12
+
+
+def test_factory_disabled():
+    assert CompressionFactory.from_settings(MockSettings({'compression': 'false'})) is None
@@ -0,0 +1,248 @@
+import asyncio
+
+import pytest
+
+from testandconquer.client import MessageType
+from testandconquer.engine import LocalClient, LocalEngine
+from testandconquer.model import Location, SuiteItem, Tag
+
+from tests.mock.settings import MockSettings
+
+
+suite_items = [
+    SuiteItem('file', Location('A.py'), size=10),
+    SuiteItem('test', Location('A.py', 'A', None, 'test_A', 1)),
+    SuiteItem('file', Location('B.py'), size=30),
+    SuiteItem('test', Location('B.py', 'B', None, 'test_B', 1)),
+    SuiteItem('file', Location('C.py'), size=20),
+    SuiteItem('test', Location('C.py', 'C', None, 'test_C', 1)),
+    SuiteItem('file', Location('conftest.py'), size=99),
+]
+
+
+def test_schedule_largest_file_first():
+    engine = LocalEngine(suite_items)
+
+    assert engine.next('w1') == {'id': '1', 'items': [{'file': 'B.py'}]}
+    assert engine.next('w2') == {'id': '2', 'items': [{'file': 'C.py'}]}
+    assert engine.next('w1') == {'id': '3', 'items': [{'file': 'A.py'}]}
+    assert engine.next('w2') is None  # files without tests are never scheduled
+
+
+def test_schedule_longest_file_first():
+    engine = LocalEngine(suite_items, durations={'A.py': 5.0, 'B.py': 1.0})
+
+    # C.py is estimated from its size: 6s for 40 bytes makes 3s for 20 bytes
+    assert [engine.next('w')['items'][0]['file'] for _ in range(3)] == ['A.py', 'C.py', 'B.py']
+
+
+@pytest.mark.asyncio()
+async def test_local_client():
+    class Subscriber:
+        def __init__(self):
+            self.received = []
+
+        async def on_server_message(self, message_type, payload):
+            self.received.append((message_type, payload))
+
+    engine = LocalEngine(suite_items)
+    client = LocalClient(MockSettings({}), engine, 'w1')
+    subscriber = Subscriber()
+    client.subscribe(subscriber)
+
+    await client.start()
+    assert subscriber.received == [
+        (MessageType.Schedules.value, [{'id': '1', 'items': [{'file': 'B.py'}]}, {'id': '2', 'items': [{'file': 'C.py'}]}]),
+    ]
+
+    subscriber.received = []
+    await client.send(MessageType.Ack, {'schedule_id': '1', 'status': 'success'})
+    assert subscriber.received == [
+        (MessageType.Schedules.value, [{'id': '3', 'items': [{'file': 'A.py'}]}]),
+    ]
+    assert list(engine.pending.keys()) == ['2', '3']
+
+    subscriber.received = []
+    await client.send(MessageType.Ack, {'schedule_id': '2', 'status': 'success'})
+    await client.send(MessageType.Report, {'items': [], 'acks': [{'schedule_id': '3', 'status': 'success'}]})
+    assert subscriber.received == [
+        (MessageType.Done.value, None),
+    ]
+
+
+def test_schedule_changed_file_first():
+    items = [i._replace(changed=True) if i.location.file == 'A.py' and i.type == 'test' else i for i in suite_items]
+    engine = LocalEngine(items)
+
+    assert [engine.next('w')['items'][0]['file'] for _ in range(3)] == ['A.py', 'B.py', 'C.py']
+
+
+def test_bundle_files_sharing_an_expensive_fixture():
+    db = SuiteItem('fixture', Location('conftest.py', 'conftest', None, 'db', 3), scope='session')
+    items = [
+        SuiteItem('test', Location('A.py', 'A', None, 'test_A', 1), deps=[db]),
+        SuiteItem('test', Location('B.py', 'B', None, 'test_B', 1), deps=[db]),
+        SuiteItem('test', Location('C.py', 'C', None, 'test_C', 1), deps=[db]),
+        SuiteItem('test', Location('D.py', 'D', None, 'test_D', 1)),
+    ]
+    durations = {'A.py': 3.0, 'B.py': 2.0, 'C.py': 2.0, 'D.py': 9.0}
+    fixture_costs = {Location('conftest.py', 'conftest', None, 'db'): 5.0}
+
+    # each of the 2 workers should take about 10.5s, so A.py and B.py share one setup of 'db' and C.py needs its own
+    engine = LocalEngine(items, durations, fixture_costs, workers=2)
+    assert [[i['file'] for i in engine.next('w')['items']] for _ in range(3)] == [['A.py', 'B.py'], ['D.py'], ['C.py']]
+    assert engine.next('w') is None
+
+
+def test_ignore_cheap_fixtures():
+    db = SuiteItem('fixture', Location('conftest.py', 'conftest', None, 'db', 3), scope='session')
+    items = [
+        SuiteItem('test', Location('A.py', 'A', None, 'test_A', 1), deps=[db]),
+        SuiteItem('test', Location('B.py', 'B', None, 'test_B', 1), deps=[db]),
+    ]
+
+    engine = LocalEngine(items, {'A.py': 2.0, 'B.py': 1.0}, {}, workers=2)
+    assert [[i['file'] for i in engine.next('w')['items']] for _ in range(2)] == [['A.py'], ['B.py']]
+
+
+def test_schedule_group_on_one_worker():
+    items = [
+        SuiteItem('test', Location('A.py', 'A', None, 'test_A', 1), tags=[Tag('db')]),
+        SuiteItem('test', Location('B.py', 'B', None, 'test_B', 1)),
+        SuiteItem('test', Location('C.py', 'C', None, 'test_C', 1), tags=[Tag('db')]),
+        SuiteItem('test', Location('D.py', 'D', None, 'test_D', 1), tags=[Tag('db'), Tag('api')]),
+        SuiteItem('test', Location('E.py', 'E', None, 'test_E', 1), tags=[Tag('api')]),
+    ]
+    durations = {'A.py': 1.0, 'B.py': 4.0, 'C.py': 1.0, 'D.py': 1.0, 'E.py': 2.0}
+
+    # the group is packed into a single schedule of 5s, so it goes first
+    engine = LocalEngine(items, durations, workers=2)
+    assert [[i['file'] for i in engine.next('w')['items']] for _ in range(2)] == [['A.py', 'C.py', 'D.py', 'E.py'], ['B.py']]
+    assert engine.next('w') is None
+
+
+def test_schedule_singleton_alone():
+    items = [
+        SuiteItem('test', Location('A.py', 'A', None, 'test_A', 1), tags=[Tag(singleton=True)]),
+        SuiteItem('test', Location('B.py', 'B', None, 'test_B', 1)),
+        SuiteItem('test', Location('C.py', 'C', None, 'test_C', 1)),
+    ]
+    engine = LocalEngine(items, {'A.py': 5.0, 'B.py': 2.0, 'C.py': 1.0}, workers=2)
+
+    assert engine.next('w1') == {'id': '1', 'items': [{'file': 'A.py'}]}
+    assert engine.next('w2') is None  # nothing runs next to a singleton
+    assert not engine.exhausted()
+    engine.complete('w1', '1')
+
+    assert engine.next('w1') == {'id': '2', 'items': [{'file': 'B.py'}]}
+    assert engine.next('w2') == {'id': '3', 'items': [{'file': 'C.py'}]}
+    assert engine.exhausted()
+
+
+def test_schedule_singleton_when_idle():
+    items = [
+        SuiteItem('test', Location('A.py', 'A', None, 'test_A', 1)),
+        SuiteItem('test', Location('B.py', 'B', None, 'test_B', 1), tags=[Tag(singleton=True)]),
+    ]
+    engine = LocalEngine(items, {'A.py': 5.0, 'B.py': 2.0}, workers=2)
+
+    assert engine.next('w1') == {'id': '1', 'items': [{'file': 'A.py'}]}
+    assert engine.next('w2') is None  # has to wait until A.py is done
+    engine.complete('w1', '1')
+    assert engine.next('w2') == {'id': '2', 'items': [{'file': 'B.py'}]}
+
+
+@pytest.mark.asyncio()
+async def test_local_client_waits_for_singleton():
+    class Subscriber:
+        def __init__(self):
+            self.received = []
+
+        async def on_server_message(self, message_type, payload):
+            self.received.append((message_type, payload))
+
+    items = [
+        SuiteItem('test', Location('A.py', 'A', None, 'test_A', 1)),
+        SuiteItem('test', Location('B.py', 'B', None, 'test_B', 1), tags=[Tag(singleton=True)]),
+    ]
+    engine = LocalEngine(items, {'A.py': 5.0, 'B.py': 2.0})
+    client = LocalClient(MockSettings({}), engine, 'w1')
+    subscriber = Subscriber()
+    client.subscribe(subscriber)
+
+    await client.start()
+    assert subscriber.received == [
+        (MessageType.Schedules.value, [{'id': '1', 'items': [{'file': 'A.py'}]}]),
+        (MessageType.Schedules.value, []),  # B.py is held back, so the worker has to finish A.py first
+    ]
+
+    subscriber.received = []
+    await asyncio.sleep(0.2)
+    assert subscriber.received[:2] == [(MessageType.Schedules.value, [])] * 2  # in case the worker waits again
+
+    subscriber.received = []
+    engine.complete('w1', '1')  # e.g. by another worker
+    await asyncio.sleep(0.2)
+    assert subscriber.received == [(MessageType.Schedules.value, [{'id': '2', 'items': [{'file': 'B.py'}]}])]
+
+    await client.stop()
+
+
+def test_split_large_file_in_the_tail():
+    items = [SuiteItem('test', Location('A.py', 'A', None, 'test_' + str(i), i)) for i in range(4)]
+    items.append(SuiteItem('test', Location('B.py', 'B', None, 'test_B', 1)))
+    test_durations = {Location('A.py', 'A', None, 'test_' + str(i)): d for i, d in enumerate([4.0, 1.0, 1.0, 2.0])}
+
+    # A.py takes 8s out of 9s, which is more than a worker's share, so its tests are spread out
+    engine = LocalEngine(items, {'A.py': 8.0, 'B.py': 1.0}, workers=2, test_durations=test_durations, split_limit=4)
+    assert engine.next('w1') == {'id': '1', 'items': [{'file': 'A.py', 'class': None, 'func': 'test_0'}]}
+    assert engine.next('w2') == {'id': '2', 'items': [
+        {'file': 'A.py', 'class': None, 'func': 'test_1'},
+        {'file': 'A.py', 'class': None, 'func': 'test_2'},
+        {'file': 'A.py', 'class': None, 'func': 'test_3'},
+    ]}
+    assert engine.next('w2') == {'id': '3', 'items': [{'file': 'B.py'}]}
+    assert engine.exhausted()
+
+    assert engine.predictions() == {'w1': pytest.approx(4.0, abs=0.5), 'w2': pytest.approx(5.0, abs=0.5)}
+
+
+def test_keep_file_whole_before_the_tail():
+    items = [SuiteItem('test', Location('A.py', 'A', None, 'test_' + str(i), i)) for i in range(2)]
+    items.extend(SuiteItem('test', Location(f, 'B', None, 'test_B', 1)) for f in ('B.py', 'C.py', 'D.py'))
+
+    engine = LocalEngine(items, {'A.py': 4.0, 'B.py': 3.0, 'C.py': 3.0, 'D.py': 3.0}, workers=2, split_limit=4)
+    assert engine.next('w1') == {'id': '1', 'items': [{'file': 'A.py'}]}
+
+
+def test_never_split_pinned_file():
+    items = [SuiteItem('test', Location('A.py', 'A', None, 'test_' + str(i), i), tags=[Tag('db')]) for i in range(2)]
+    items.append(SuiteItem('test', Location('B.py', 'B', None, 'test_B', 1)))
+
+    engine = LocalEngine(items, {'A.py': 8.0, 'B.py': 1.0}, workers=2, split_limit=4)
+    assert engine.next('w1') == {'id': '1', 'items': [{'file': 'A.py'}]}
+
+
+def test_predict_completion():
+    engine = LocalEngine(suite_items, durations={'A.py': 1.0, 'B.py': 3.0, 'C.py': 2.0}, workers=2)
+    engine.next('w1')
+    engine.next('w2')
+    engine.next('w2')
+    assert engine.predictions() == {'w1': pytest.approx(3.0, abs=0.5), 'w2': pytest.approx(3.0, abs=0.5)}
+
+    engine.complete('w1', '1')  # earlier than predicted
+    assert engine.predictions()['w1'] == pytest.approx(0.0, abs=0.5)
+
+
+def test_split_while_singleton_waits():
+    items = [SuiteItem('test', Location('x.py', 'x', None, 'test_x', 1))]
+    items.extend(SuiteItem('test', Location('a.py', 'a', None, 'test_' + str(i), i)) for i in range(4))
+    items.append(SuiteItem('test', Location('b.py', 'b', None, 'test_b', 1), tags=[Tag(singleton=True)]))
+    items.append(SuiteItem('test', Location('c.py', 'c', None, 'test_c', 1)))
+
+    engine = LocalEngine(items, {'x.py': 20.0, 'a.py': 10.0, 'b.py': 6.0, 'c.py': 1.0}, workers=4, split_limit=4)
+    assert engine.next('w1') == {'id': '1', 'items': [{'file': 'x.py'}]}
+    schedule = engine.next('w2')  # a.py is split, but b.py still has to wait for x.py
+    assert [item['file'] for item in schedule['items']] == ['a.py']
+    assert 'func' in schedule['items'][0]
+    assert all(files != ('b.py',) for files, _, _ in engine.pending.values())
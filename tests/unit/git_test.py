@@ -0,0 +1,69 @@
+import subprocess
+
+import pytest
+
+from testandconquer.git import Git
+
+
+@pytest.fixture
+def repo(tmpdir):
+    def git(*args):
+        return subprocess.check_output(['git'] + list(args), cwd=str(tmpdir)).decode('utf-8').strip()
+
+    git('init', '-q')
+    git('config', 'user.email', 'dev@example.com')
+    git('config', 'user.name', 'dev')
+    git('remote', 'add', 'origin', 'git@github.com:myorg/myrepo.git')
+    git('checkout', '-q', '-b', 'my-branch')
+    git('commit', '-q', '--allow-empty', '-m', 'first commit\n\nwith a body')
+    return git, str(tmpdir)
+
+
+def test_read_metadata(repo):
+    git, path = repo
+    subdir = path + '/sub'
+    subprocess.check_call(['mkdir', subdir])
+
+    assert Git.read(subdir) == {
+        'branch': 'my-branch',
+        'repo': 'git@github.com:myorg/myrepo.git',
+        'revision': git('rev-parse', 'HEAD'),
+        'revision_message': 'first commit\n\nwith a body',
+    }
+
+
+def test_read_packed_metadata(repo):
+    git, path = repo
+    git('gc', '-q')
+
+    metadata = Git.read(path)
+    assert metadata['revision'] == git('rev-parse', 'HEAD')
+    assert metadata['revision_message'] == 'first commit\n\nwith a body'
+
+
+def test_read_detached_head(repo):
+    git, path = repo
+    git('checkout', '-q', '--detach')
+
+    metadata = Git.read(path)
+    assert metadata['branch'] == 'HEAD'
+    assert metadata['revision'] == git('rev-parse', 'HEAD')
+
+
+def test_read_without_repository(tmpdir, mocker):
+    mocker.patch.object(Git, 'find_git_dir', return_value=None)
+    assert Git.read(str(tmpdir)) == {}
+
+
+def test_changed_files(repo):
+    git, path = repo
+    base = git('rev-parse', 'HEAD')
+    with open(path + '/test_a.py', 'w') as f:
+        f.write('')
+    git('add', 'test_a.py')
+    git('commit', '-q', '-m', 'add test')
+    with open(path + '/test_b.py', 'w') as f:
+        f.write('')
+
+    assert Git.changed_files(path, base) == {'test_a.py', 'test_b.py'}
+    assert Git.changed_files(path, 'unknown-revision') is None
@@ -0,0 +1,75 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from testandconquer.history import History
+from testandconquer.model import Duration, Location, ReportItem
+
+
+start = datetime(2000, 1, 1)
+test_location = Location('A.py', 'A', 'TestClass', 'test_A')  # lines are not stored, they change too often
+fixture_location = Location('conftest.py', 'conftest', None, 'fixture')
+
+
+def item(type, location, seconds):
+    return ReportItem(type, location, 'passed', None, start, start + timedelta(seconds=seconds))
+
+
+def test_load_without_database(tmp_path):
+    history = History(str(tmp_path / 'history.sqlite'))
+    assert history.load() == {}
+    assert history.file_durations() == {}
+
+
+def test_save_and_load(tmp_path):
+    history = History(str(tmp_path / 'history.sqlite'))
+    history.record(item('test', test_location, 1.0))
+    history.record(item('setup', fixture_location, 0.5))
+    history.record(ReportItem('test', Location('B.py'), 'skipped'))  # no timings, ignored
+    history.save()
+
+    assert History(history.path).load() == {
+        ('test', test_location): Duration(1, 1.0, 1.0),
+        ('setup', fixture_location): Duration(1, 0.5, 0.5),
+    }
+
+
+def test_rolling_statistics(tmp_path):
+    history = History(str(tmp_path / 'history.sqlite'))
+    for seconds in [1.0, 2.0, 10.0]:
+        history.record(item('test', test_location, seconds))
+        history.save()  # one save per run
+
+    duration = history.load()[('test', test_location)]
+    assert duration.count == 3
+    assert round(duration.ewma, 2) == 3.91
+    assert duration.p95 == 10.0
+
+
+def test_file_durations(tmp_path):
+    history = History(str(tmp_path / 'history.sqlite'))
+    history.record(item('test', test_location, 1.0))
+    history.record(item('test', test_location._replace(func='test_B'), 2.0))
+    history.record(item('setup', fixture_location, 0.5))
+    history.save()
+
+    assert history.file_durations() == {'A.py': 3.0, 'conftest.py': 0.5}
+    assert history.setup_durations() == {fixture_location: 0.5}
+    assert history.test_durations() == {test_location: 1.0, test_location._replace(func='test_B'): 2.0}
+
+
+def test_load_durations_once(tmp_path, mocker):
+    history = History(str(tmp_path / 'history.sqlite'))
+    history.record(item('test', test_location, 1.0))
+    history.save()
+
+    load = mocker.spy(history, 'load')
+    history.file_durations()
+    history.test_durations()
+    history.setup_durations()
+    assert load.call_count == 1
+
+    history.record(item('test', test_location, 3.0))
+    history.save()
+    assert history.test_durations() == {test_location: pytest.approx(1.6)}
+    assert load.call_count == 2
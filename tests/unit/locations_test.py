@@ -0,0 +1,90 @@
+import inspect
+import os
+
+from testandconquer.locations import LocationCache, class_lines, source_line
+
+
+class MockCache:
+    def __init__(self):
+        self.data = {}
+
+    def get(self, key, default):
+        return self.data.get(key, default)
+
+    def set(self, key, value):
+        self.data[key] = value
+
+
+def test_reuse_lines_of_unchanged_file(tmpdir):
+    path = str(tmpdir.join('test_a.py'))
+    with open(path, 'w') as f:
+        f.write('def test_a():\n    pass\n')
+    cache = MockCache()
+
+    locations = LocationCache(cache)
+    assert locations.line(path, 'test_a') is None
+    locations.store(path, 'test_a', 1)
+    locations.save()
+
+    locations = LocationCache(cache)
+    assert locations.line(path, 'test_a') == 1
+
+
+def test_discard_lines_of_changed_file(tmpdir):
+    path = str(tmpdir.join('test_a.py'))
+    with open(path, 'w') as f:
+        f.write('def test_a():\n    pass\n')
+    cache = MockCache()
+
+    locations = LocationCache(cache)
+    locations.store(path, 'test_a', 1)
+    locations.save()
+
+    with open(path, 'w') as f:
+        f.write('\n\ndef test_a():\n    pass\n')
+
+    locations = LocationCache(cache)
+    assert locations.line(path, 'test_a') is None
+
+
+def test_forget_deleted_file(tmpdir):
+    path = str(tmpdir.join('test_a.py'))
+    with open(path, 'w') as f:
+        f.write('def test_a():\n    pass\n')
+    cache = MockCache()
+
+    locations = LocationCache(cache)
+    locations.store(path, 'test_a', 1)
+    locations.save()
+    os.remove(path)
+
+    locations = LocationCache(cache)
+    locations.store(str(tmpdir.join('test_b.py')), 'test_b', 1)
+    locations.save()
+    assert list(cache.data[LocationCache.key].keys()) == [str(tmpdir.join('test_b.py'))]
+
+
+def test_source_line():
+    for obj in (Decorated, Decorated.Nested, Decorated.test_method, Decorated().test_method, decorated_function, MockCache):
+        assert source_line(obj) == inspect.getsourcelines(obj)[1], obj
+    assert class_lines(__file__)['Decorated.Nested'] == inspect.getsourcelines(Decorated.Nested)[1]
+
+
+def decorator(obj):
+    return obj
+
+
+@decorator
+class Decorated:
+
+    class Nested:
+        pass
+
+    @decorator
+    def test_method(self):
+        pass
+
+
+@decorator
+def decorated_function():
+    pass
@@ -63,6 +63,29 @@ def test_fails_for_old_pytest_version(datetime_mock, caplog):
     testandconquer.plugin.fatal_error = None
 
 
+@patch('testandconquer.plugin.gc')
+def test_prepare_fork_freezes_collected_objects(mock_gc):
+    import testandconquer.plugin  # has to be inline since the module can't be loaded upfront due to pytester
+    testandconquer.plugin.prepare_fork()
+    mock_gc.collect.assert_called_once_with()
+    mock_gc.freeze.assert_called_once_with()
+    testandconquer.plugin.finish_fork()
+    mock_gc.unfreeze.assert_called_once_with()
+
+
+def test_tests_for_schedule_item(mocker):
+    import testandconquer.plugin  # has to be inline since the module can't be loaded upfront due to pytester
+    from testandconquer.model import ScheduleItem
+    mocker.patch.object(testandconquer.plugin, 'tests_by_file', {'file.py': ['test_A', 'test_B', 'test_C']})
+    mocker.patch.object(testandconquer.plugin, 'tests_by_class', {('file.py', 'TestClass'): ['test_A', 'test_B']})
+    mocker.patch.object(testandconquer.plugin, 'tests_by_location', {('file.py', 'TestClass', 'test_A'): 'test_A'})
+
+    assert testandconquer.plugin.tests_for_schedule_item(ScheduleItem('file.py')) == ['test_A', 'test_B', 'test_C']
+    assert testandconquer.plugin.tests_for_schedule_item(ScheduleItem('file.py', 'TestClass')) == ['test_A', 'test_B']
+    assert testandconquer.plugin.tests_for_schedule_item(ScheduleItem('file.py', 'TestClass', 'test_A')) == ['test_A']
+    assert testandconquer.plugin.tests_for_schedule_item(ScheduleItem('file.py', 'TestClass', 'test_X')) == []
+
+
 @pytest.fixture(scope='module', autouse=True)
 def mock_generate_settings():
     import testandconquer.plugin  # has to be inline since the module can't be loaded upfront due to pytester
@@ -70,3 +93,107 @@ def mock_generate_settings():
     testandconquer.plugin.create_settings = lambda config: MockSettings({'enabled': True})
     yield  # run test
     testandconquer.plugin.create_settings = previous
+
+
+def test_singleton_with_work_stealing(monkeypatch):
+    import testandconquer.plugin as plugin  # has to be inline since the module can't be loaded upfront due to pytester
+    from collections import defaultdict
+    import threading
+    import time
+
+    from testandconquer.engine import LocalEngine
+    from testandconquer.model import Location, SuiteItem, Tag
+    from testandconquer.runqueue import ScheduleTracker
+
+    class Hook:
+        def __init__(self):
+            self.lock = threading.Lock()
+            self.running = set()
+            self.ran = []
+            self.overlapped = False
+
+        def pytest_runtest_protocol(self, item, nextitem):
+            with self.lock:
+                self.running.add(item.name)
+                self.overlapped |= 'single' in self.running and len(self.running) > 1
+            time.sleep(0.002)
+            with self.lock:
+                self.running.remove(item.name)
+                self.ran.append(item.name)
+
+    class MockTest:
+        def __init__(self, name):
+            self.name = name
+            self.config = mock.Mock(hook=hook)
+
+    hook = Hook()
+    suite_items, tests_by_file = [], defaultdict(list)
+    for file, names in [('f1.py', ['f1_' + str(i) for i in range(12)]),
+                        ('f2.py', ['f2_' + str(i) for i in range(12)]),
+                        ('f3.py', ['f3_' + str(i) for i in range(12)]),
+                        ('single.py', ['single'])]:
+        for name in names:
+            tags = [Tag(singleton=True)] if name == 'single' else None
+            suite_items.append(SuiteItem('test', Location(file, file[:-3], None, name, 1), tags=tags))
+            tests_by_file[file].append(MockTest(name))
+
+    settings = MockSettings({'engine': 'local', 'work_stealing': 'true'})
+    monkeypatch.setattr(plugin, 'settings', settings)
+    monkeypatch.setattr(plugin, 'suite_items', suite_items)
+    monkeypatch.setattr(plugin, 'tests_by_file', tests_by_file)
+    monkeypatch.setattr(plugin, 'pinned_files', LocalEngine.pinned_files(suite_items))
+    engine = LocalEngine(suite_items, workers=4)
+    monkeypatch.setattr(plugin, 'local_engine', engine)
+    monkeypatch.setattr(plugin, 'schedule_tracker', ScheduleTracker())
+    monkeypatch.setattr(plugin, 'run_queues', {})
+    monkeypatch.setattr(plugin, 'report_items_by_worker', {})
+    monkeypatch.setattr(plugin, 'schedulers', [])
+
+    workers = [plugin.Worker(args=[None, settings, None]) for _ in range(4)]
+    for worker in workers:
+        worker.daemon = True  # so a deadlock fails the test instead of hanging it
+        worker.start()
+    for worker in workers:
+        worker.join(timeout=10)
+
+    assert not any(worker.is_alive() for worker in workers)
+    assert sorted(hook.ran) == sorted(item.location.func for item in suite_items)
+    assert not hook.overlapped
+    assert not engine.pending  # every schedule was reported, including the ones that were stolen from
+    assert plugin.fatal_error is None
+
+
+def test_deselect_unaffected_tests_sharing_a_location(monkeypatch):
+    import testandconquer.plugin as plugin  # has to be inline since the module can't be loaded upfront due to pytester
+    from collections import defaultdict
+
+    from testandconquer.model import Location, SuiteItem
+
+    class MockNode:
+        def __init__(self, location):
+            self.__location__ = location
+
+    changed, unchanged = Location('A.py', 'A', None, 'test_a', 1), Location('B.py', 'B', None, 'test_b', 1)
+    nodes = [MockNode(changed), MockNode(unchanged), MockNode(unchanged)]  # e.g. test_b is defined twice
+    tests_by_file, tests_by_class, tests_by_location = defaultdict(list), defaultdict(list), {}
+    for node in nodes:
+        location = node.__location__
+        tests_by_file[location.file].append(node)
+        tests_by_class[(location.file, location.cls)].append(node)
+        tests_by_location[(location.file, location.cls, location.func)] = node
+
+    monkeypatch.setattr(plugin, 'settings', MockSettings({}))
+    monkeypatch.setattr(plugin, 'suite_items', [SuiteItem('test', changed), SuiteItem('test', unchanged)])
+    monkeypatch.setattr(plugin, 'tests_by_file', tests_by_file)
+    monkeypatch.setattr(plugin, 'tests_by_class', tests_by_class)
+    monkeypatch.setattr(plugin, 'tests_by_location', tests_by_location)
+    monkeypatch.setattr(plugin.Git, 'changed_files', staticmethod(lambda cwd, base: {'A.py'}))
+    session = mock.Mock()
+
+    plugin.select_changed(session, 'master', 'only')
+
+    assert tests_by_file == {'A.py': [nodes[0]], 'B.py': []}
+    assert tests_by_class == {('A.py', None): [nodes[0]], ('B.py', None): []}
+    assert list(tests_by_location) == [('A.py', None, 'test_a')]
+    assert plugin.suite_items == [SuiteItem('test', changed)]
+    session.config.hook.pytest_deselected.assert_called_once_with(items=[nodes[1], nodes[2]])
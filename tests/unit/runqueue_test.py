@@ -0,0 +1,59 @@
+from testandconquer.runqueue import RunQueue, ScheduleTracker
+
+
+def test_pop_and_peek():
+    queue = RunQueue()
+    queue.extend(['A', 'B'])
+
+    assert queue.pop() == 'A'
+    assert queue.peek() == 'B'
+    assert queue.pop() == 'B'
+    assert queue.pop() is None
+    assert queue.peek() is None
+
+
+def test_priority_and_requeue():
+    queue = RunQueue()
+    queue.extend(['A', 'B'])
+    queue.extend(['C', 'D'], priority=True)
+    queue.requeue('E')
+
+    assert [queue.pop() for _ in range(len(queue))] == ['E', 'C', 'D', 'A', 'B']
+
+
+def test_steal():
+    queue = RunQueue()
+    queue.extend(['A', 'B', 'C', 'D', 'E'])
+
+    assert queue.steal() == ['D', 'E']
+    assert queue.steal() == ['C']
+    assert queue.steal() == ['B']
+    assert queue.steal() == []  # the next test stays with its worker
+    assert len(queue) == 1
+
+
+def test_steal_stops_at_pinned_test():
+    queue = RunQueue()
+    queue.extend(['A', 'B', 'C', 'D'])
+
+    assert queue.steal(stealable=lambda test: test != 'C') == ['D']
+    assert len(queue) == 3
+
+
+def test_track_schedule_across_workers():
+    tracker = ScheduleTracker()
+    owner, thief = object(), object()
+    tracker.add(('w1', 'ID'), owner, ['A', 'B'], '<pending>', '<started>')
+
+    assert tracker.owner(('w1', 'ID')) is owner
+    assert tracker.complete(('w1', 'ID'), ['a']) is None
+    assert tracker.wait(owner, timeout=0) is False  # B is still running elsewhere
+    assert tracker.wait(thief, timeout=0) is True
+
+    assert tracker.complete(('w1', 'ID'), ['b']) == {
+        'owner': owner, 'left': 0, 'items': ['a', 'b'], 'pending_at': '<pending>', 'started_at': '<started>',
+    }
+    assert tracker.wait(owner, timeout=0) is False  # the report hasn't gone out yet
+
+    tracker.release(('w1', 'ID'))
+    assert tracker.wait(owner, timeout=0) is True
@@ -1,10 +1,13 @@
+import asyncio
+import hashlib
+import json
 from datetime import datetime
 
 import pytest
 
 from testandconquer.client import MessageType
 from testandconquer.model import Location, Report, Schedule, SuiteItem
-from testandconquer.scheduler import Scheduler
+from testandconquer.scheduler import Scheduler, SuiteCache, estimate_size
 
 from unittest import mock
 from tests.mock.client import MockClient
@@ -51,25 +54,90 @@ async def test_reply_to_schedule_message():
     await scheduler.stop()
 
 
+@pytest.mark.asyncio()
+async def test_reply_to_empty_schedule_message():
+    settings = MockSettings({})
+    client = MockClient(settings)
+    scheduler = Scheduler(settings, client, [], 'my_worker_id')
+
+    await scheduler.on_server_message(MessageType.Schedules.value, [])
+    await scheduler.on_server_message(MessageType.Schedules.value, [])
+
+    assert await scheduler.next() == Schedule(None, [])  # tells the worker there is nothing to wait for right now
+    assert scheduler.schedule_queue.empty()  # once is enough
+    assert not scheduler.done
+
+    await scheduler.stop()
+
+
 @pytest.mark.asyncio()
 async def test_reply_to_suite_message():
     class MockSerializer:
         @staticmethod
         def serialize_suite(suite_items):
-            return suite_items
+            return {'items': suite_items}
 
     settings = MockSettings({})
     client = MockClient(settings)
     suite_items = [SuiteItem('test', Location('tests/IT/stub/stub_A.py', 'stub_A', 'TestClass', 'test_A', 1))]
     scheduler = Scheduler(settings, client, suite_items, 'my_worker_id', MockSerializer)
+    other_scheduler = Scheduler(settings, client, suite_items, 'my_other_worker_id', MockSerializer)
 
     await scheduler.on_server_message(MessageType.Suite.value, None)
+    await other_scheduler.on_server_message(MessageType.Suite.value, {})
+    await other_scheduler.on_server_message(MessageType.Suite.value, {'full': True})
 
+    suite_hash = hashlib.sha1(json.dumps({'items': suite_items}, sort_keys=True).encode('utf-8')).hexdigest()
     assert client.received == [
-        (MessageType.Suite, suite_items),
+        (MessageType.Suite, {'items': suite_items, 'hash': suite_hash}),
+        (MessageType.Suite, {'hash': suite_hash}),  # no need to upload it twice
+        (MessageType.Suite, {'items': suite_items, 'hash': suite_hash}),  # unless the server asks for it
     ]
 
     await scheduler.stop()
+    await other_scheduler.stop()
+
+
+def test_suite_diff(tmpdir):
+    class MockCache:
+        @staticmethod
+        def makedir(name):
+            return tmpdir
+
+    class MockConfig:
+        cache = MockCache
+
+    class MockSerializer:
+        @staticmethod
+        def serialize_suite(suite_items):
+            return {'items': suite_items}
+
+    def item(func, line=1):
+        return {'type': 'test', 'location': {'file': 'test_a.py', 'func': func, 'line': line}}
+
+    cache = SuiteCache()
+    cache.open(MockConfig())
+    cache.serialize(MockSerializer, [item('test_1'), item('test_2'), item('test_3')])
+    assert cache.diff() is None  # nothing to compare against yet
+    cache.remember()
+    base = cache.hash
+
+    cache = SuiteCache()
+    cache.open(MockConfig())
+    cache.serialize(MockSerializer, [item('test_1'), item('test_2', line=5), item('test_4')])
+    assert cache.diff() == {
+        'hash': cache.hash,
+        'base': base,
+        'added': [item('test_4')],
+        'changed': [item('test_2', line=5)],
+        'removed': [item('test_3')],
+    }
+    cache.remember()
+
+    cache = SuiteCache()
+    cache.open(MockConfig())
+    cache.serialize(MockSerializer, [item('test_1'), item('test_2', line=5), item('test_4')])
+    assert cache.diff() == {'hash': cache.hash, 'base': cache.hash, 'added': [], 'changed': [], 'removed': []}
 
 
 @pytest.mark.asyncio()
@@ -141,3 +209,99 @@ async def test_report():
         (MessageType.Ack, {'schedule_id': 'ID', 'status': 'success'}),
         (MessageType.Report, report),
     ]
+
+
+@pytest.mark.asyncio()
+async def test_report_with_adaptive_prefetch():
+    class MockSerializer:
+        @staticmethod
+        def serialize_report(report):
+            return report
+
+    settings = MockSettings({'prefetch': 'auto'})
+    client = MockClient(settings)
+    scheduler = Scheduler(settings, client, [], 'my_worker_id', MockSerializer)
+    assert scheduler.prefetch_window == 1  # nothing measured yet
+
+    scheduler.round_trip = 2.5
+    report = Report('ID', [], None, datetime(2000, 1, 1, 0, 0, 0), datetime(2000, 1, 1, 0, 0, 1))
+    await scheduler.report(report)
+
+    await scheduler.stop()  # flushes reports
+
+    assert client.received == [
+        (MessageType.Ack, {'schedule_id': 'ID', 'status': 'success', 'prefetch': 4}),
+        (MessageType.Report, report),
+    ]
+
+
+@pytest.mark.asyncio()
+async def test_stream_report_items():
+    class MockSerializer:
+        @staticmethod
+        def serialize_report_item(schedule_id, item):
+            return {'schedule_id': schedule_id, 'name': item}
+
+        @staticmethod
+        def serialize_report_timings(report):
+            return {'finished_at': report.finished_at}
+
+    settings = MockSettings({'report_stream': True, 'report_batch_items': '3'})
+    client = MockClient(settings)
+    scheduler = Scheduler(settings, client, [], 'my_worker_id', MockSerializer)
+
+    await scheduler.stream('ID', ['A', 'B'])
+    assert client.received == []  # still below the batch limit
+
+    await scheduler.stream('ID', ['C'])
+    await scheduler.report(Report('ID', ['D'], None, None, '<finished>'))
+
+    assert client.received == [
+        (MessageType.Report, {'items': [
+            {'schedule_id': 'ID', 'name': 'A'},
+            {'schedule_id': 'ID', 'name': 'B'},
+            {'schedule_id': 'ID', 'name': 'C'},
+        ], 'acks': []}),
+        (MessageType.Report, {'items': [
+            {'schedule_id': 'ID', 'name': 'D'},
+        ], 'acks': [
+            {'schedule_id': 'ID', 'status': 'success', 'finished_at': '<finished>'},
+        ]}),
+    ]
+
+    await scheduler.stop()
+
+
+@pytest.mark.asyncio()
+async def test_stream_flushes_after_interval():
+    class MockSerializer:
+        @staticmethod
+        def serialize_report_item(schedule_id, item):
+            return {'schedule_id': schedule_id, 'name': item}
+
+    settings = MockSettings({'report_stream': True, 'report_batch_interval': '10'})
+    client = MockClient(settings)
+    scheduler = Scheduler(settings, client, [], 'my_worker_id', MockSerializer)
+
+    await scheduler.stream('ID', ['A'])
+    await asyncio.sleep(0.05)
+
+    assert client.received == [
+        (MessageType.Report, {'items': [{'schedule_id': 'ID', 'name': 'A'}], 'acks': []}),
+    ]
+
+    await scheduler.stop()
+
+
+def test_estimate_size():
+    item = {
+        'type': 'test',
+        'location': {'file': 'tests/test_a.py', 'module': 'test_a', 'class': 'TestA', 'func': 'test_a', 'line': 12},
+        'status': 'failed',
+        'started_at': '2000-01-01T00:00:00.000Z',
+        'finished_at': '2000-01-01T00:00:00.000Z',
+    }
+    assert estimate_size(item) == pytest.approx(len(json.dumps(item)), rel=0.25)
+
+    item['error'] = {'type': 'AssertionError', 'message': 'assert 1 + 1 == 4' * 100}
+    assert estimate_size(item) == pytest.approx(len(json.dumps(item)), rel=0.1)
@@ -0,0 +1,43 @@
+from datetime import datetime, timezone
+
+from testandconquer.model import Location, Report, ReportItem, SuiteItem
+from testandconquer.serializer import CompactSerializer
+
+
+time = datetime(2000, 1, 1, 0, 0, 0, 0, tzinfo=timezone.utc)
+
+
+def test_compact_suite_shares_locations():
+    fixture = SuiteItem('fixture', Location('tests/fixtures.py', 'fixtures', None, 'db', 1))
+    suite_items = [
+        SuiteItem('test', Location('tests/test_a.py', 'test_a', None, 'test_1', 1), deps=[fixture]),
+        SuiteItem('test', Location('tests/test_a.py', 'test_a', None, 'test_2', 5), deps=[fixture]),
+    ]
+
+    data = CompactSerializer.serialize_suite(suite_items)
+
+    assert data['locations'] == [
+        {'file': 'tests/test_a.py', 'module': 'test_a', 'func': 'test_1', 'line': 1},
+        {'file': 'tests/fixtures.py', 'module': 'fixtures', 'func': 'db', 'line': 1},
+        {'file': 'tests/test_a.py', 'module': 'test_a', 'func': 'test_2', 'line': 5},
+    ]
+    assert data['items'] == [
+        {'type': 'test', 'location': 0, 'deps': [{'type': 'fixture', 'location': 1}]},
+        {'type': 'test', 'location': 2, 'deps': [{'type': 'fixture', 'location': 1}]},
+    ]
+
+
+def test_compact_report_refers_to_suite_locations():
+    known = Location('tests/test_a.py', 'test_a', None, 'test_1', 1)
+    unknown = Location('tests/test_a.py', 'test_a', None, 'test_3', 9)
+    CompactSerializer.serialize_suite([SuiteItem('test', known)])
+
+    data = CompactSerializer.serialize_report(Report('0', [
+        ReportItem('test', known, 'passed', None, time, time),
+        ReportItem('test', unknown, 'passed', None, time, time),
+    ], time, time, time))
+
+    assert [i['location'] for i in data['items']] == [
+        0,
+        {'file': 'tests/test_a.py', 'module': 'test_a', 'func': 'test_3', 'line': 9},
+    ]
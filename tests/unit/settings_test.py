@@ -94,6 +94,30 @@ class TestSettings():
         settings = Settings({})
         assert settings.client_workers == 1
 
+    def test_compression(self):
+        settings = Settings({'compression': 'false', 'compression_mem_level': '9', 'compression_threshold': '1024', 'compression_window_bits': '10'})
+        assert settings.compression is False
+        assert settings.compression_mem_level == 9
+        assert settings.compression_threshold == 1024
+        assert settings.compression_window_bits == 10
+
+    def test_changed(self):
+        settings = Settings({'changed_mode': 'only', 'changed_since': 'origin/master'})
+        assert settings.changed_mode == 'only'
+        assert settings.changed_since == 'origin/master'
+
+    def test_changed_default(self):
+        settings = Settings({})
+        assert settings.changed_mode == 'prioritize'
+        assert settings.changed_since is None
+
+    def test_compression_default(self):
+        settings = Settings({})
+        assert settings.compression is True
+        assert settings.compression_mem_level == 8
+        assert settings.compression_threshold == 256
+        assert settings.compression_window_bits == 15
+
     def test_debug(self):
         settings = Settings({'debug': True})
         assert settings.debug is True
@@ -113,6 +137,10 @@ class TestSettings():
         assert settings.enabled is True
         settings = Settings({'enabled': 'TRUE'})
         assert settings.enabled is True
+        settings = Settings({'enabled': 'no'})
+        assert settings.enabled is False
+        settings = Settings({'multiplex': 'yes'})
+        assert settings.multiplex is False  # only 'true' counts
 
     def test_enabled_default(self):
         settings = Settings({'enabled': False})
@@ -129,6 +157,98 @@ class TestSettings():
         settings = Settings({})
         assert settings.platform_version == '_VERSION_'
 
+    def test_fixture_grouping(self):
+        settings = Settings({'fixture_grouping': 'true', 'fixture_grouping_threshold': '100'})
+        assert settings.fixture_grouping is True
+        assert settings.fixture_grouping_threshold == 100
+
+    def test_fixture_grouping_default(self):
+        settings = Settings({})
+        assert settings.fixture_grouping is False
+        assert settings.fixture_grouping_threshold == 500
+
+    def test_location_table(self):
+        settings = Settings({'location_table': 'true'})
+        assert settings.location_table is True
+
+    def test_location_table_default(self):
+        settings = Settings({})
+        assert settings.location_table is False
+
+    def test_message_format(self):
+        settings = Settings({'message_format': 'msgpack'})
+        assert settings.message_format == 'msgpack'
+
+    def test_message_format_default(self):
+        settings = Settings({})
+        assert settings.message_format == 'json'
+
+    def test_multiplex(self):
+        settings = Settings({'multiplex': 'true'})
+        assert settings.multiplex is True
+
+    def test_multiplex_default(self):
+        settings = Settings({})
+        assert settings.multiplex is False
+
+    def test_prefetch(self):
+        settings = Settings({'prefetch': '3'})
+        assert settings.prefetch == 3
+        settings = Settings({'prefetch': 'auto'})
+        assert settings.prefetch == 'auto'
+
+    def test_prefetch_default(self):
+        settings = Settings({})
+        assert settings.prefetch == 1
+
+    def test_replay_limit(self):
+        settings = Settings({'replay_limit': '10'})
+        assert settings.replay_limit == 10
+
+    def test_replay_limit_default(self):
+        settings = Settings({})
+        assert settings.replay_limit == 1000
+
+    def test_report_batch(self):
+        settings = Settings({'report_batch_bytes': '1024', 'report_batch_interval': '250', 'report_batch_items': '10', 'report_stream': 'true'})
+        assert settings.report_batch_bytes == 1024
+        assert settings.report_batch_interval == 250
+        assert settings.report_batch_items == 10
+        assert settings.report_stream is True
+
+    def test_report_batch_default(self):
+        settings = Settings({})
+        assert settings.report_batch_bytes == 65536
+        assert settings.report_batch_interval == 1000
+        assert settings.report_batch_items == 100
+        assert settings.report_stream is False
+
+    def test_send_queue(self):
+        settings = Settings({'send_queue_limit': '50', 'send_queue_spill': 'disk'})
+        assert settings.send_queue_limit == 50
+        assert settings.send_queue_spill == 'disk'
+
+    def test_send_queue_default(self):
+        settings = Settings({})
+        assert settings.send_queue_limit == 1000
+        assert settings.send_queue_spill == 'block'
+
+    def test_suite_diff(self):
+        settings = Settings({'suite_diff': 'true'})
+        assert settings.suite_diff is True
+
+    def test_suite_diff_default(self):
+        settings = Settings({})
+        assert settings.suite_diff is False
+
+    def test_split_limit(self):
+        settings = Settings({'split_limit': '2'})
+        assert settings.split_limit == 2
+
+    def test_split_limit_default(self):
+        settings = Settings({})
+        assert settings.split_limit == 4
+
     def test_system_context(self):
         settings = Settings({'system_context': {'env': 'var'}})
         assert settings.system_context == {'env': 'var'}
@@ -157,11 +277,68 @@ class TestSettings():
         settings = Settings({'vcs_tag': '1.0'})
         assert settings.vcs_tag == '1.0'
 
+    def test_work_stealing(self):
+        settings = Settings({'work_stealing': 'true'})
+        assert settings.work_stealing is True
+
+    def test_work_stealing_default(self):
+        settings = Settings({})
+        assert settings.work_stealing is False
+
+    def test_worker_mode(self):
+        settings = Settings({'worker_mode': 'process'})
+        assert settings.worker_mode == 'process'
+
+    def test_worker_mode_default(self):
+        settings = Settings({})
+        assert settings.worker_mode == 'thread'
+
+    def test_engine(self):
+        settings = Settings({'engine': 'local'})
+        assert settings.engine == 'local'
+
+    def test_engine_default(self):
+        settings = Settings({})
+        assert settings.engine == 'remote'
+
     def test_get_nonexistent_variable(self):
         settings = Settings({})
         assert settings.nonexistent is None
 
 
+class TestSettingsCache():
+
+    def test_resolve_once(self, mocker):
+        revision = mocker.patch('testandconquer.git.Git.revision', return_value='347adksanv')
+        settings = Settings({})
+        assert settings.vcs_revision == '347adksanv'
+        assert settings.vcs_revision == '347adksanv'
+        assert revision.call_count == 1
+
+    def test_look_up_default_once(self, mocker):
+        revision = mocker.patch('testandconquer.git.Git.revision', return_value='347adksanv')
+        settings = Settings({'vcs_revision': 'bcd8ab3'})
+        assert settings.vcs_revision == 'bcd8ab3'
+        settings.cache.clear()  # e.g. after reading the config file
+        assert settings.vcs_revision == 'bcd8ab3'
+        assert revision.call_count == 1  # to find out how to convert the value
+
+    def test_cache_error(self, mocker):
+        revision = mocker.patch('testandconquer.git.Git.revision', return_value=None)
+        settings = Settings({})
+        for _ in range(2):
+            with pytest.raises(ValueError, match="missing repository revision, please set 'vcs_revision'"):
+                settings.vcs_revision
+        assert revision.call_count == 1
+
+    @pytest.mark.asyncio()
+    async def test_invalidate_on_mapping(self):
+        settings = Settings({})
+        assert settings.system_provider is None
+        await settings.on_server_message(MessageType.Envs.value, [])
+        assert settings.system_provider == 'unknown'
+
+
 class TestSettingsInit():
 
     def test_get_variable_from_args(self):